@@ -0,0 +1,92 @@
+"""Microbenchmark: per-row dict conversion vs compiled per-column converters
+
+Run with: python bench_converters.py [rows]
+Uses synthetic dine_bill / dine_kot_sales_detail shaped rows, no database needed.
+"""
+
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from sync import compile_row_converter
+
+BILL_TYPES = {'billno': 'id_str', 'time': 'iso', 'user': 'strip', 'amount': 'float', 'date': 'iso'}
+KOT_TYPES = {'slno': 'id_str', 'billno': 'id_str', 'item': 'strip', 'qty': 'float', 'rate': 'float'}
+
+
+def legacy_bill(row, fields):
+    """Conversion chain used before converters were compiled"""
+    row_dict = dict(zip(fields, row))
+    if row_dict.get('billno') is not None:
+        row_dict['billno'] = str(int(float(row_dict['billno'])))
+    if row_dict.get('time'):
+        row_dict['time'] = row_dict['time'].isoformat() if hasattr(row_dict['time'], 'isoformat') else str(row_dict['time'])
+    if row_dict.get('user'):
+        row_dict['user'] = str(row_dict['user']).strip()
+    if row_dict.get('amount') is not None:
+        row_dict['amount'] = float(row_dict['amount'])
+    if row_dict.get('date'):
+        row_dict['date'] = row_dict['date'].isoformat() if hasattr(row_dict['date'], 'isoformat') else str(row_dict['date'])
+    return tuple(row_dict.values())
+
+
+def legacy_kot(row, fields):
+    row_dict = dict(zip(fields, row))
+    if row_dict.get('slno') is not None:
+        row_dict['slno'] = str(int(float(row_dict['slno'])))
+    if row_dict.get('billno') is not None:
+        row_dict['billno'] = str(int(float(row_dict['billno'])))
+    if row_dict.get('item'):
+        row_dict['item'] = str(row_dict['item']).strip()
+    if row_dict.get('qty') is not None:
+        row_dict['qty'] = float(row_dict['qty'])
+    if row_dict.get('rate') is not None:
+        row_dict['rate'] = float(row_dict['rate'])
+    return tuple(row_dict.values())
+
+
+def make_rows(count):
+    start = datetime(2026, 1, 1)
+    bills = [
+        (Decimal(n), start + timedelta(minutes=n), ' cashier ', Decimal('123.45'), (start + timedelta(minutes=n)).date())
+        for n in range(count)
+    ]
+    kots = [
+        (Decimal(n), Decimal(n // 3), ' Masala Dosa ', Decimal('2.000'), Decimal('80.00'))
+        for n in range(count)
+    ]
+    return bills, kots
+
+
+def rate(label, func, rows):
+    began = time.perf_counter()
+    for row in rows:
+        func(row)
+    elapsed = time.perf_counter() - began
+    per_sec = len(rows) / elapsed if elapsed else float('inf')
+    print(f"  {label:<10} {per_sec:>12,.0f} rows/sec")
+    return per_sec
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    bills, kots = make_rows(count)
+    bill_fields = ['billno', 'time', 'user', 'amount', 'date']
+    kot_fields = ['slno', 'billno', 'item', 'qty', 'rate']
+
+    cases = [
+        ("dine_bill", bills, bill_fields, legacy_bill, BILL_TYPES),
+        ("dine_kot_sales_detail", kots, kot_fields, legacy_kot, KOT_TYPES),
+    ]
+    for name, rows, fields, legacy, column_types in cases:
+        compiled = compile_row_converter(fields, None, column_types)
+        assert compiled(rows[0]) == legacy(rows[0], fields)
+        print(f"{name} ({count:,} rows)")
+        before = rate("dict", lambda row: legacy(row, fields), rows)
+        after = rate("compiled", compiled, rows)
+        print(f"  speedup    {after / before:>12.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,56 @@
 # sync.py - Complete Database Sync Tool with Terminal Display
 import pyodbc
 import requests
+from requests.adapters import HTTPAdapter
+import gzip
+import hashlib
 import json
+from json.encoder import encode_basestring_ascii
 import logging
 import sys
 import os
-from datetime import datetime
+import random
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta
+from datetime import time as dt_time
 from decimal import Decimal
+from operator import eq, ge, gt, itemgetter, le, lt
 import time
+from collections import deque
+from queue import Empty, Full, Queue
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import zstandard
+except ImportError:  # optional: zstd request compression falls back to gzip without it
+    zstandard = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # ---------- HELPERS ----------
+# HTTP statuses worth retrying; anything else that is not 200 is treated as fatal for the batch
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
 def decimal_to_float(obj):
     """JSON encoder helper: Decimal → float"""
     if isinstance(obj, Decimal):
         return float(obj)
     raise TypeError
 
+def format_batch_numbers(numbers):
+    """Compact a sorted list of batch numbers, e.g. [1, 2, 3, 5] -> '1-3, 5'"""
+    ranges = []
+    for num in numbers:
+        if ranges and ranges[-1][1] == num - 1:
+            ranges[-1][1] = num
+        else:
+            ranges.append([num, num])
+    return ', '.join(str(a) if a == b else f"{a}-{b}" for a, b in ranges) or 'none'
+
 def print_header():
     """Print a nice header for the sync process"""
     print("=" * 70)
@@ -25,20 +60,24 @@ def print_header():
     print("=" * 70)
     print()
 
+_print_lock = threading.Lock()
+
 def print_status(message, status="INFO"):
     """Print status messages with timestamps"""
     timestamp = datetime.now().strftime('%H:%M:%S')
     if status == "SUCCESS":
-        print(f"[{timestamp}] SUCCESS: {message}")
+        line = f"[{timestamp}] SUCCESS: {message}"
     elif status == "ERROR":
-        print(f"[{timestamp}] ERROR: {message}")
+        line = f"[{timestamp}] ERROR: {message}"
     elif status == "PROGRESS":
-        print(f"[{timestamp}] PROGRESS: {message}")
+        line = f"[{timestamp}] PROGRESS: {message}"
     else:
-        print(f"[{timestamp}] INFO: {message}")
+        line = f"[{timestamp}] INFO: {message}"
     
-    # Force flush to ensure immediate display
-    sys.stdout.flush()
+    # Syncs run in parallel threads, so write whole lines and force flush to ensure immediate display
+    with _print_lock:
+        print(line)
+        sys.stdout.flush()
 
 def print_summary(results):
     """Print final summary"""
@@ -56,19 +95,560 @@ def print_summary(results):
     print("=" * 70)
     print(f"Summary: {success_count}/{total_count} tables synced successfully")
     
-    if success_count == total_count:
+    if total_count and success_count == total_count:
         print("All synchronizations completed successfully!")
+    elif not total_count:
+        print("No tables were synced. Check the \"tables\" list in config.json.")
     else:
         print("One or more synchronizations failed. Check sync.log for details.")
     
     print("=" * 70)
 
 
+# ---------- ROW CONVERSION ----------
+def to_id_str(value):
+    """Numeric key -> '123' (billno, slno)"""
+    return None if value is None else str(int(float(value)))
+
+def to_iso(value):
+    """datetime/date -> ISO string; other truthy values -> str"""
+    try:
+        return value.isoformat()
+    except AttributeError:
+        return str(value) if value else value
+
+def to_stripped(value):
+    """Strip whitespace from text fields if they exist"""
+    return str(value).strip() if value else value
+
+def to_text(value):
+    """Stripped text, with '' for empty or missing values"""
+    return str(value).strip() if value else ''
+
+def to_float(value):
+    """Decimal/number -> float so it serializes as a JSON number"""
+    return None if value is None else float(value)
+
+# Column type names usable in a table spec's column_types; "raw" passes the value through
+COLUMN_CONVERTERS = {
+    'id_str': to_id_str,
+    'iso': to_iso,
+    'strip': to_stripped,
+    'text': to_text,
+    'float': to_float,
+    'raw': None,
+}
+
+def infer_column_type(type_code):
+    """Column type for a cursor.description type code when none is configured"""
+    if type_code in (datetime, date, dt_time):
+        return 'iso'
+    if type_code is Decimal:
+        return 'float'
+    return 'raw'
+
+def compile_row_converter(fields, description, column_types):
+    """Build, once per query, a function converting a cursor row into a tuple of JSON-ready values
+
+    Each column gets its converter from column_types (by field name) or from its
+    cursor.description type. Only the converted columns are visited per row;
+    pass-through columns are copied as they are and no dict is built per row.
+    """
+    converters = []
+    for index, field in enumerate(fields):
+        type_code = description[index][1] if description else None
+        kind = column_types.get(field) or infer_column_type(type_code)
+        if COLUMN_CONVERTERS[kind] is not None:
+            converters.append((index, COLUMN_CONVERTERS[kind]))
+    converters = tuple(converters)
+    
+    def convert(row):
+        values = list(row)
+        for index, converter in converters:
+            values[index] = converter(values[index])
+        return tuple(values)
+    return convert
+
+
+# ---------- JSON ENCODING ----------
+# Formatters write one converted value as JSON text, giving the same output as
+# json.dumps (ASCII-escaped strings, repr floats) without a default hook per value
+def json_string(value):
+    return 'null' if value is None else encode_basestring_ascii(value)
+
+def json_number(value):
+    if value is None:
+        return 'null'
+    text = repr(value)
+    # nan/inf are not plain JSON numbers; let json spell them as it always has
+    return text if text[-1].isdigit() else json.dumps(value)
+
+def json_value(value):
+    """Formatter for columns of unknown type"""
+    kind = type(value)
+    if kind is str:
+        return encode_basestring_ascii(value)
+    if kind is float or kind is Decimal:
+        return json_number(float(value))
+    if value is None:
+        return 'null'
+    return json.dumps(value, default=decimal_to_float, separators=(',', ':'))
+
+# Column types whose converted values are always str or always float (or None);
+# "iso" and "strip" pass falsy non-strings such as 0 through, so they get json_value
+JSON_FORMATTERS = {
+    'id_str': json_string,
+    'text': json_string,
+    'float': json_number,
+}
+
+def column_formatters(fields, column_types):
+    return [JSON_FORMATTERS.get(column_types.get(field), json_value) for field in fields]
+
+def compile_row_encoder(fields, column_types):
+    """Build a function writing one converted row tuple as a JSON object string
+
+    The object is a single %-template with the keys already encoded, filled
+    from one formatter call per column.
+    """
+    template = '{' + ','.join(encode_basestring_ascii(field).replace('%', '%%') + ':%s' for field in fields) + '}'
+    formatters = tuple(column_formatters(fields, column_types))
+    
+    def encode(row):
+        return template % tuple([formatter(value) for formatter, value in zip(formatters, row)])
+    return encode
+
+
+# ---------- LOCAL STATE ----------
+class StateStore:
+    """Small SQLite key/value store for sync progress that must survive restarts"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS sync_state ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, updated_at TEXT NOT NULL)"
+        )
+        self.conn.commit()
+
+    def get(self, key, default=None):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set(self, key, value):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sync_state (key, value, updated_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, default=decimal_to_float), datetime.now().isoformat())
+            )
+            self.conn.commit()
+
+    def delete(self, key):
+        with self.lock:
+            self.conn.execute("DELETE FROM sync_state WHERE key = ?", (key,))
+            self.conn.commit()
+
+
+# ---------- OUTBOX ----------
+class Outbox:
+    """Append-only queue of encoded batches waiting for the API, kept in the state database
+
+    Entries are delivered in insertion order per endpoint. An entry the API
+    rejects outright is flagged dead (kept for inspection, never retried).
+    """
+
+    def __init__(self, state):
+        self.state = state
+        with state.lock:
+            state.conn.execute(
+                "CREATE TABLE IF NOT EXISTS outbox ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, endpoint TEXT NOT NULL, body BLOB NOT NULL, "
+                "created_at TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, dead INTEGER NOT NULL DEFAULT 0)"
+            )
+            state.conn.commit()
+
+    def append(self, endpoint, body):
+        with self.state.lock:
+            self.state.conn.execute(
+                "INSERT INTO outbox (endpoint, body, created_at) VALUES (?, ?, ?)",
+                (endpoint, sqlite3.Binary(body), datetime.now().isoformat())
+            )
+            self.state.conn.commit()
+
+    def pending(self, endpoint=None):
+        sql = "SELECT COUNT(*) FROM outbox WHERE dead = 0"
+        params = ()
+        if endpoint is not None:
+            sql += " AND endpoint = ?"
+            params = (endpoint,)
+        with self.state.lock:
+            return self.state.conn.execute(sql, params).fetchone()[0]
+
+    def endpoints(self):
+        with self.state.lock:
+            rows = self.state.conn.execute(
+                "SELECT endpoint FROM outbox WHERE dead = 0 GROUP BY endpoint ORDER BY MIN(id)"
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def oldest(self, endpoint):
+        """(id, body) of the next entry to deliver for endpoint, or None"""
+        with self.state.lock:
+            row = self.state.conn.execute(
+                "SELECT id, body FROM outbox WHERE endpoint = ? AND dead = 0 ORDER BY id LIMIT 1", (endpoint,)
+            ).fetchone()
+        return (row[0], bytes(row[1])) if row else None
+
+    def remove(self, entry_id):
+        with self.state.lock:
+            self.state.conn.execute("DELETE FROM outbox WHERE id = ?", (entry_id,))
+            self.state.conn.commit()
+
+    def mark_attempt(self, entry_id, dead=False):
+        with self.state.lock:
+            self.state.conn.execute(
+                "UPDATE outbox SET attempts = attempts + 1, dead = ? WHERE id = ?", (1 if dead else 0, entry_id)
+            )
+            self.state.conn.commit()
+
+
+# ---------- ROW SNAPSHOTS ----------
+class SnapshotStore:
+    """Content hash of every row last acknowledged by the API, per table, kept in the state database
+
+    Lets reference tables send only the rows that were inserted or changed
+    since the last successful run, and notice rows that disappeared.
+    """
+
+    def __init__(self, state):
+        self.state = state
+        with state.lock:
+            state.conn.execute(
+                "CREATE TABLE IF NOT EXISTS row_snapshot ("
+                "scope TEXT NOT NULL, row_key TEXT NOT NULL, digest TEXT NOT NULL, PRIMARY KEY (scope, row_key))"
+            )
+            state.conn.commit()
+
+    def hashes(self, scope):
+        """{row key: digest} for a table"""
+        with self.state.lock:
+            rows = self.state.conn.execute(
+                "SELECT row_key, digest FROM row_snapshot WHERE scope = ?", (scope,)
+            ).fetchall()
+        return dict(rows)
+
+    def count(self, scope):
+        with self.state.lock:
+            return self.state.conn.execute("SELECT COUNT(*) FROM row_snapshot WHERE scope = ?", (scope,)).fetchone()[0]
+
+    def apply(self, scope, changed, deleted):
+        """Store new digests for changed {row key: digest} and drop deleted row keys, in one transaction"""
+        with self.state.lock:
+            self.state.conn.executemany(
+                "INSERT OR REPLACE INTO row_snapshot (scope, row_key, digest) VALUES (?, ?, ?)",
+                [(scope, key, digest) for key, digest in changed.items()]
+            )
+            self.state.conn.executemany(
+                "DELETE FROM row_snapshot WHERE scope = ? AND row_key = ?", [(scope, key) for key in deleted]
+            )
+            self.state.conn.commit()
+
+
+# ---------- KEY SETS ----------
+# Keys are stored with the values the database returned, so tombstones carry the
+# same values as the upserts; Decimals and times are tagged to survive JSON
+KEY_TYPES = {'decimal': Decimal, 'datetime': datetime.fromisoformat, 'date': date.fromisoformat}
+
+def key_to_json(key):
+    return json.dumps([
+        {'decimal': str(value)} if isinstance(value, Decimal) else
+        {'datetime': value.isoformat()} if isinstance(value, datetime) else
+        {'date': value.isoformat()} if isinstance(value, date) else value
+        for value in key
+    ])
+
+def key_from_json(text):
+    return tuple(
+        KEY_TYPES[next(iter(value))](next(iter(value.values()))) if isinstance(value, dict) else value
+        for value in json.loads(text)
+    )
+
+
+class KeySetStore:
+    """Primary keys of each table as last reported to the API, stored in key order
+
+    Keys are read back in chunks by sequence number, so a key set of any size
+    can be merged against the database without loading it into memory. A new
+    set is written under a staging scope and swapped in with publish().
+    """
+
+    def __init__(self, state):
+        self.state = state
+        with state.lock:
+            state.conn.execute(
+                "CREATE TABLE IF NOT EXISTS key_set ("
+                "scope TEXT NOT NULL, seq INTEGER NOT NULL, row_key TEXT NOT NULL, PRIMARY KEY (scope, seq))"
+            )
+            state.conn.commit()
+
+    def exists(self, scope):
+        with self.state.lock:
+            return self.state.conn.execute("SELECT 1 FROM key_set WHERE scope = ? LIMIT 1", (scope,)).fetchone() is not None
+
+    def iter_keys(self, scope, chunk_size=1000):
+        """Yield the stored keys (tuples) in order"""
+        last_seq = -1
+        while True:
+            with self.state.lock:
+                rows = self.state.conn.execute(
+                    "SELECT seq, row_key FROM key_set WHERE scope = ? AND seq > ? ORDER BY seq LIMIT ?",
+                    (scope, last_seq, chunk_size)
+                ).fetchall()
+            if not rows:
+                return
+            for seq, row_key in rows:
+                yield key_from_json(row_key)
+            last_seq = rows[-1][0]
+
+    def append(self, scope, start_seq, keys):
+        with self.state.lock:
+            self.state.conn.executemany(
+                "INSERT INTO key_set (scope, seq, row_key) VALUES (?, ?, ?)",
+                [(scope, start_seq + i, key_to_json(key)) for i, key in enumerate(keys)]
+            )
+            self.state.conn.commit()
+
+    def clear(self, scope):
+        with self.state.lock:
+            self.state.conn.execute("DELETE FROM key_set WHERE scope = ?", (scope,))
+            self.state.conn.commit()
+
+    def publish(self, staging, scope):
+        """Replace the key set of scope with the one written under staging"""
+        with self.state.lock:
+            self.state.conn.execute("DELETE FROM key_set WHERE scope = ?", (scope,))
+            self.state.conn.execute("UPDATE key_set SET scope = ? WHERE scope = ?", (scope, staging))
+            self.state.conn.commit()
+
+
+class OutboxDrainer(threading.Thread):
+    """Background thread that uploads outbox entries in order once the API answers again
+
+    Retries back off from outbox.drain_interval up to outbox.max_backoff
+    seconds while the API stays unreachable.
+    """
+
+    def __init__(self, sync):
+        super().__init__(name='outbox-drainer', daemon=True)
+        self.sync = sync
+        outbox_cfg = sync.config.get('outbox', {})
+        self.interval = outbox_cfg.get('drain_interval', 5.0)
+        self.max_backoff = outbox_cfg.get('max_backoff', 60.0)
+        self.stop_event = threading.Event()
+        self.drain_lock = threading.Lock()
+
+    def drain_once(self):
+        """Deliver everything deliverable now; False when the API is still unavailable"""
+        outbox = self.sync.outbox
+        with self.drain_lock:
+            for endpoint in outbox.endpoints():
+                timeout = self.sync.request_timeout(self.sync.endpoint_key(endpoint), 300)
+                while True:
+                    entry = outbox.oldest(endpoint)
+                    if entry is None:
+                        break
+                    entry_id, body = entry
+                    ok, response, retryable = self.sync.deliver(endpoint, body, timeout=timeout, max_attempts=1)
+                    if ok:
+                        outbox.remove(entry_id)
+                        self.sync.logger.info(f"Outbox entry {entry_id} delivered to {endpoint}")
+                        continue
+                    outbox.mark_attempt(entry_id, dead=not retryable)
+                    if retryable:
+                        return False
+                    self.sync.logger.error(f"Outbox entry {entry_id} rejected by {endpoint}, kept as dead: {response}")
+        return True
+
+    def run(self):
+        wait = self.interval
+        while not self.stop_event.is_set():
+            wait = self.interval if self.drain_once() else min(wait * 2, self.max_backoff)
+            self.stop_event.wait(wait)
+
+    def stop(self):
+        """Stop the thread after one last drain attempt; returns the number of entries still queued"""
+        self.stop_event.set()
+        self.join()
+        self.drain_once()
+        return self.sync.outbox.pending()
+
+
+# ---------- DATABASE POOL ----------
+class ConnectionPool:
+    """Process-wide pool of ODBC connections shared by all sync classes
+
+    At most max_size connections are checked out at once. Idle connections are
+    health-checked before reuse and replaced transparently when they have gone
+    stale (server restart, network drop).
+    """
+
+    def __init__(self, open_connection, max_size=4, health_query="SELECT 1"):
+        self.open_connection = open_connection
+        self.max_size = max_size
+        self.health_query = health_query
+        self.idle = []
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(max_size)
+
+    def is_healthy(self, conn):
+        try:
+            cursor = conn.cursor()
+            cursor.execute(self.health_query)
+            cursor.fetchone()
+            cursor.close()
+            return True
+        except pyodbc.Error:
+            return False
+
+    def discard(self, conn):
+        try:
+            conn.close()
+        except pyodbc.Error:
+            pass
+
+    def acquire(self):
+        """Return a validated connection, opening a new one if no idle connection is usable"""
+        self.slots.acquire()
+        try:
+            while True:
+                with self.lock:
+                    conn = self.idle.pop() if self.idle else None
+                if conn is None:
+                    break
+                if self.is_healthy(conn):
+                    return conn
+                self.discard(conn)
+            return self.open_connection()
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def release(self, conn):
+        """Return a connection to the pool; connections that cannot roll back are dropped"""
+        try:
+            conn.rollback()
+            with self.lock:
+                self.idle.append(conn)
+        except pyodbc.Error:
+            self.discard(conn)
+        finally:
+            self.slots.release()
+
+    def close_all(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for conn in idle:
+            self.discard(conn)
+
+
+# ---------- BATCH SIZING ----------
+class AdaptiveBatcher:
+    """Chooses the size of the next batch from the latency, payload size and outcome of the last ones
+
+    Batch size moves towards the number of records that would take
+    target_latency seconds to upload, by at most 2x per request. Failed or
+    timed-out requests halve it. max_bytes caps the encoded payload size.
+    With adaptive set to False the size stays fixed at the initial value.
+    """
+
+    def __init__(self, initial, min_size=50, max_size=5000, target_latency=5.0,
+                 max_bytes=4 * 1024 * 1024, adaptive=True):
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size)
+        self.target_latency = target_latency
+        self.max_bytes = max_bytes
+        self.adaptive = adaptive
+        self.size = initial if not adaptive else self.clamp(initial)
+        self.lock = threading.Lock()
+
+    def clamp(self, size):
+        return int(min(self.max_size, max(self.min_size, size)))
+
+    def record(self, records, latency, payload_bytes, ok):
+        """Feed back one finished request; returns the (old, new) batch size"""
+        with self.lock:
+            old = self.size
+            if not self.adaptive or records == 0:
+                return old, old
+            if not ok:
+                new = old / 2
+            else:
+                ideal = records * self.target_latency / max(latency, 0.001)
+                new = min(max(ideal, old / 2), old * 2)
+                if payload_bytes:
+                    new = min(new, self.max_bytes * records / payload_bytes)
+            self.size = self.clamp(new)
+            return old, self.size
+
+
+# ---------- RATE LIMITING ----------
+class TokenBucket:
+    """Thread-safe token bucket; acquire() blocks until the requested amount is budgeted
+
+    Requests larger than the bucket capacity are allowed by going into debt,
+    so a single big payload is delayed rather than rejected.
+    A rate of None or 0 means unlimited.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        """Take amount tokens and sleep until they are covered; returns the seconds waited"""
+        if not self.rate:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
 class BaseSync:
+    _state = None
+    _outbox = None
+    _snapshots = None
+    _key_sets = None
+    _state_lock = threading.Lock()
+    _pool = None
+    _pool_lock = threading.Lock()
+    _session = None
+    _session_lock = threading.Lock()
+    _http_slots = None
+    _retries_left = None
+    _retry_lock = threading.Lock()
+    _rate_limiters = {}
+
     def __init__(self, cfg_key):
         self.config_key = cfg_key
         self.config = self.load_config()
         self.setup_logging()
+        self.state = self.open_state()
+        self.outbox = BaseSync._outbox
+        self.snapshots = BaseSync._snapshots
+        self.key_sets = BaseSync._key_sets
+        self.row_encoders = {}
 
     # ---------- CONFIG / LOG ----------
     def load_config(self):
@@ -95,554 +675,1684 @@ class BaseSync:
         )
         self.logger = logging.getLogger(self.__class__.__name__)
 
+    # ---------- STATE / WATERMARKS ----------
+    def open_state(self):
+        """Open the process-wide state store (sync_state.db next to sync.log by default)"""
+        with BaseSync._state_lock:
+            if BaseSync._state is None:
+                path = self.config.get('state', {}).get('path', 'sync_state.db')
+                BaseSync._state = StateStore(path)
+                BaseSync._outbox = Outbox(BaseSync._state)
+                BaseSync._snapshots = SnapshotStore(BaseSync._state)
+                BaseSync._key_sets = KeySetStore(BaseSync._state)
+            return BaseSync._state
+
+    def state_key(self, name):
+        """State keys are scoped per outlet (DSN) so one PC can sync several databases"""
+        return f"{self.config['database']['dsn']}:{name}"
+
+    def get_watermark(self, table):
+        return self.state.get(self.state_key(f"{table}:watermark"))
+
+    def set_watermark(self, table, value):
+        self.state.set(self.state_key(f"{table}:watermark"), value)
+
+    # A checkpoint records the query window of an upload in progress and the key of
+    # the last acknowledged batch, so a run killed midway resumes where it stopped
+    def load_checkpoint(self, table):
+        return self.state.get(self.state_key(f"{table}:checkpoint"))
+
+    def save_checkpoint(self, table, window, last_key):
+        self.state.set(self.state_key(f"{table}:checkpoint"), {'window': window, 'last_key': last_key})
+
+    def clear_checkpoint(self, table):
+        self.state.delete(self.state_key(f"{table}:checkpoint"))
+
     # ---------- DATABASE ----------
+    def open_connection(self):
+        db_cfg = self.config['database']
+        conn_str = f"DSN={db_cfg['dsn']};UID={db_cfg['username']};PWD={db_cfg['password']}"
+        print_status(f"Connecting to DSN: {db_cfg['dsn']}", "PROGRESS")
+        conn = pyodbc.connect(conn_str)
+        print_status("Database connection successful", "SUCCESS")
+        return conn
+
+    def connection_pool(self):
+        with BaseSync._pool_lock:
+            if BaseSync._pool is None:
+                db_cfg = self.config['database']
+                BaseSync._pool = ConnectionPool(
+                    self.open_connection,
+                    max_size=db_cfg.get('pool_size', 4),
+                    health_query=db_cfg.get('health_query', 'SELECT 1')
+                )
+            return BaseSync._pool
+
     def connect_to_database(self):
+        """Check a connection out of the shared pool; hand it back with release_connection()"""
         try:
-            db_cfg = self.config['database']
-            conn_str = f"DSN={db_cfg['dsn']};UID={db_cfg['username']};PWD={db_cfg['password']}"
-            print_status(f"Connecting to DSN: {db_cfg['dsn']}", "PROGRESS")
-            conn = pyodbc.connect(conn_str)
-            print_status("Database connection successful", "SUCCESS")
-            return conn
+            return self.connection_pool().acquire()
         except pyodbc.Error as e:
+            db_cfg = self.config['database']
             print_status(f"Database connection failed: {e}", "ERROR")
             print(f"\nERROR: Could not connect to database. Check ODBC configuration.")
             print(f"DSN: {db_cfg['dsn']}\nError: {e}")
             return None
 
-    # ---------- API ----------
-    def api_post(self, endpoint, data, timeout=None):
-        url = f"{self.config['api']['base_url']}{endpoint}"
-        headers = {'Content-Type': 'application/json'}
+    def release_connection(self, conn):
+        self.connection_pool().release(conn)
+
+    @classmethod
+    def close_pool(cls):
+        with cls._pool_lock:
+            if cls._pool is not None:
+                cls._pool.close_all()
+                cls._pool = None
+
+    # ---------- STREAMING ----------
+    def iter_rows(self, cursor, fetch_size=500):
+        """Yield cursor rows chunk by chunk with fetchmany instead of materializing the result set"""
+        while True:
+            chunk = cursor.fetchmany(fetch_size)
+            if not chunk:
+                break
+            for row in chunk:
+                yield row
+
+    def iter_batches(self, records, batch_size):
+        """Group a record stream into lists of at most batch_size records
+
+        batch_size may be an int or an AdaptiveBatcher, whose current size is
+        read again each time a new batch starts.
+        """
+        batch = []
+        for record in records:
+            batch.append(record)
+            limit = batch_size.size if isinstance(batch_size, AdaptiveBatcher) else batch_size
+            if len(batch) >= limit:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def prefetch(self, items, depth, label):
+        """Iterate items in a background thread, keeping up to depth of them ready in a bounded queue
+
+        The producer thread runs the fetch/convert work (the database cursor)
+        while the caller encodes and uploads, and blocks once depth items are
+        waiting, so a slow API holds back the database instead of filling
+        memory. Errors in the producer are raised in the caller. Closing the
+        returned generator stops the producer and waits for it, after which
+        items may be iterated again from the caller's thread. depth 0 disables
+        the thread.
+        """
+        if depth <= 0:
+            yield from items
+            return
         
-        # Use custom timeout if provided, otherwise use config timeout
-        request_timeout = timeout or self.config['api']['timeout']
+        ready = Queue(maxsize=depth)
+        stop = threading.Event()
         
+        def put(entry):
+            while not stop.is_set():
+                try:
+                    ready.put(entry, timeout=0.1)
+                    return True
+                except Full:
+                    continue
+            return False
+        
+        def produce():
+            try:
+                for item in items:
+                    if not put(('item', item)):
+                        return
+            except BaseException as e:
+                put(('error', e))
+                return
+            put(('done', None))
+        
+        producer = threading.Thread(target=produce, name=f"prefetch-{label}", daemon=True)
+        producer.start()
         try:
-            resp = requests.post(
-                url,
-                data=json.dumps(data, default=decimal_to_float),
-                headers=headers,
-                timeout=request_timeout
+            while True:
+                try:
+                    kind, value = ready.get(timeout=0.5)
+                except Empty:
+                    if not producer.is_alive() and ready.empty():
+                        return
+                    continue
+                if kind == 'done':
+                    return
+                if kind == 'error':
+                    raise value
+                yield value
+        finally:
+            stop.set()
+            producer.join()
+
+    def make_batcher(self, initial):
+        """Adaptive batcher starting at initial records per batch"""
+        adaptive_cfg = self.config['api'].get('adaptive_batching', {})
+        return AdaptiveBatcher(
+            initial,
+            min_size=adaptive_cfg.get('min_size', 50),
+            max_size=adaptive_cfg.get('max_size', 5000),
+            target_latency=adaptive_cfg.get('target_latency', 5.0),
+            max_bytes=adaptive_cfg.get('max_bytes', 4 * 1024 * 1024),
+            adaptive=adaptive_cfg.get('enabled', True)
+        )
+
+    def upload_batches(self, endpoint, batches, label, timeout=None, on_ack=None, max_in_flight=None, batcher=None,
+                       use_outbox=False, fields=None, column_types=None):
+        """Post batches as they fill, keeping up to max_in_flight requests open at once
+
+        Results are settled in submission order. on_ack(batch) is called only
+        for the unbroken run of acknowledged batches from the start, which is
+        where callers advance their persisted watermark. Once a batch fails no
+        new batches are sent; batches already in flight are allowed to finish
+        and the log lists exactly which batches landed. When the batches come
+        from an AdaptiveBatcher, pass it as batcher so it learns from each request.
+        use_outbox lets batches fall back to the local outbox (see timed_post)
+        when the outbox is enabled in config; after the first batch goes there,
+        every later batch of the upload follows it instead of being posted.
+        With fields, batches hold row tuples in that field order and are
+        encoded with encode_rows, using column_types to pick each column's
+        JSON formatter.
+        Returns (ok, records_sent, batches_sent).
+        """
+        if max_in_flight is None:
+            max_in_flight = self.config['api'].get('max_in_flight', 3)
+        max_in_flight = max(1, max_in_flight)
+        use_outbox = use_outbox and self.config.get('outbox', {}).get('enabled', True)
+        diverted = threading.Event()
+        
+        in_flight = deque()
+        landed, failed = [], []
+        records_sent = 0
+        batch_num = 0
+        
+        def settle(num, batch, payload_bytes, future):
+            nonlocal records_sent
+            ok, response, elapsed = future.result()
+            if batcher is not None and elapsed is not None:
+                old_size, new_size = batcher.record(len(batch), elapsed, payload_bytes, ok)
+                if new_size != old_size:
+                    self.logger.info(
+                        f"{label} batch size {old_size} -> {new_size} "
+                        f"(batch {num}: {elapsed:.2f}s, {payload_bytes} bytes)"
+                    )
+            if not ok:
+                failed.append(num)
+                self.logger.error(f"{label} batch {num} failed. Response: {response}")
+                print_status(f"{label} batch {num} failed: {response}", "ERROR")
+                return
+            landed.append(num)
+            records_sent += len(batch)
+            if on_ack and not failed:
+                on_ack(batch)
+        
+        with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            for batch in batches:
+                if failed:
+                    break
+                batch_num += 1
+                
+                self.logger.info(f"Sending {label} batch {batch_num} ({len(batch)} records)")
+                print_status(f"Sending {label} batch {batch_num} ({len(batch)} records)", "PROGRESS")
+                if fields is not None:
+                    body = self.encode_rows(endpoint, fields, batch, column_types)
+                else:
+                    body = self.encode_payload(batch)
+                in_flight.append((batch_num, batch, len(body), executor.submit(self.timed_post, endpoint, body, timeout, use_outbox, diverted)))
+                
+                # Wait for the oldest request when the window is full; settle finished ones early
+                while in_flight and (len(in_flight) >= max_in_flight or in_flight[0][3].done()):
+                    settle(*in_flight.popleft())
+            
+            while in_flight:
+                settle(*in_flight.popleft())
+        
+        if failed:
+            self.logger.error(
+                f"{label} upload stopped: batches landed: {format_batch_numbers(landed)}; "
+                f"batches failed: {format_batch_numbers(failed)}"
             )
-            return resp.status_code == 200, resp.json() if resp.text else {}
-        except requests.RequestException as e:
-            return False, str(e)
+            return False, records_sent, len(landed)
+        return True, records_sent, len(landed)
 
+    # ---------- API ----------
+    def http_session(self):
+        """Keep-alive session shared by all sync classes so batches reuse TCP/TLS connections"""
+        with BaseSync._session_lock:
+            if BaseSync._session is None:
+                pool_size = self.config['api'].get('pool_size', 10)
+                adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+                session = requests.Session()
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.headers.update({'Content-Type': 'application/json'})
+                BaseSync._session = session
+            return BaseSync._session
 
-# ---------- ACC_USERS ----------
-class AccUsersSync(BaseSync):
-    def __init__(self):
-        super().__init__('sync')
+    def http_slots(self):
+        """Process-wide cap on concurrent API requests across all syncs running in parallel"""
+        with BaseSync._session_lock:
+            if BaseSync._http_slots is None:
+                BaseSync._http_slots = threading.BoundedSemaphore(
+                    self.config['api'].get('max_concurrent_requests', 6)
+                )
+            return BaseSync._http_slots
 
-    def fetch(self, conn):
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, pass AS password FROM acc_users")
-        rows = [
-            {
-                'id': row.id.strip() if row.id else '',
-                'password': row.password.strip() if row.password else ''
-            }
-            for row in cursor
-        ]
-        cursor.close()
-        self.logger.info(f"Fetched {len(rows)} acc_users records")
-        print_status(f"Fetched {len(rows)} user records", "SUCCESS")
-        return rows
+    @classmethod
+    def close_session(cls):
+        with cls._session_lock:
+            if cls._session is not None:
+                cls._session.close()
+                cls._session = None
 
-    def run(self):
-        print_status("Starting User Accounts sync...", "PROGRESS")
-        conn = self.connect_to_database()
-        if not conn:
-            return False
-        try:
-            data = self.fetch(conn)
-            if data is None:
-                return False
-            
-            print_status(f"Sending {len(data)} user records to API...", "PROGRESS")
-            ok, _ = self.api_post(self.config['api']['endpoint'], data)
-            if ok:
-                self.logger.info("AccUsers sync completed")
-                print_status("User Accounts sync completed", "SUCCESS")
+    def endpoint_key(self, endpoint):
+        """Config key (e.g. "kot_sales_endpoint") of an endpoint path, or None"""
+        return next((key for key, value in self.config['api'].items() if value == endpoint), None)
+
+    def request_timeout(self, endpoint_key, default=None):
+        """Timeout for an endpoint from api.timeouts, else the given default, else api.timeout"""
+        api_cfg = self.config['api']
+        return api_cfg.get('timeouts', {}).get(endpoint_key, default or api_cfg['timeout'])
+
+    def rate_limiter(self, endpoint):
+        """(requests bucket, bytes bucket) for an endpoint, shared by every sync posting to it
+
+        Limits come from api.rate_limits, keyed by endpoint config key (e.g.
+        "kot_sales_endpoint") with "default" as the fallback.
+        """
+        with BaseSync._session_lock:
+            if endpoint not in BaseSync._rate_limiters:
+                limits_cfg = self.config['api'].get('rate_limits', {})
+                limits = limits_cfg.get(self.endpoint_key(endpoint), limits_cfg.get('default', {}))
+                BaseSync._rate_limiters[endpoint] = (
+                    TokenBucket(limits.get('requests_per_sec'), limits.get('burst')),
+                    TokenBucket(limits.get('bytes_per_sec'), limits.get('burst_bytes'))
+                )
+            return BaseSync._rate_limiters[endpoint]
+
+    def compress_body(self, endpoint, body):
+        """Compress a request body as configured in api.compression; returns (body, content_encoding)
+
+        api.compression maps endpoint config keys (or "default") to "gzip",
+        "zstd" or "none". Bodies smaller than api.compression.min_bytes are
+        sent as they are. Everything is sent uncompressed by default; turn an
+        endpoint on (e.g. "kot_sales_endpoint": "gzip") only once the API
+        accepts request bodies with that Content-Encoding, since a server that
+        does not answers 400 and the batch fails without retries.
+        """
+        compression_cfg = self.config['api'].get('compression', {})
+        method = compression_cfg.get(self.endpoint_key(endpoint), compression_cfg.get('default', 'none'))
+        if method in (None, 'none') or len(body) < compression_cfg.get('min_bytes', 1024):
+            return body, None
+        if method == 'zstd' and zstandard is None:
+            self.logger.debug("zstandard is not installed, using gzip instead of zstd")
+            method = 'gzip'
+        
+        if method == 'zstd':
+            compressed = zstandard.ZstdCompressor(level=compression_cfg.get('zstd_level', 3)).compress(body)
+        else:
+            compressed = gzip.compress(body, compresslevel=compression_cfg.get('gzip_level', 6))
+        self.logger.info(
+            f"POST {endpoint} body {len(body)} -> {len(compressed)} bytes "
+            f"({method}, {len(compressed) / len(body):.0%} of raw)"
+        )
+        return compressed, method
+
+    def encode_payload(self, data):
+        return json.dumps(data, default=decimal_to_float).encode('utf-8')
+
+    def json_backend(self):
+        """"orjson" or "builtin", from api.json_encoder ("auto" uses orjson when it is installed)"""
+        choice = self.config['api'].get('json_encoder', 'auto')
+        if choice == 'builtin':
+            return 'builtin'
+        if orjson is None:
+            if choice == 'orjson':
+                self.logger.debug("orjson is not installed, using the built-in row encoder")
+            return 'builtin'
+        return 'orjson'
+
+    def encode_rows(self, endpoint, fields, rows, column_types=None):
+        """Encode row tuples in the endpoint's api.payload_format ("rows" or "columnar")
+
+        "rows" is the usual list of {field: value} objects. "columnar" sends one
+        schema header and one array per field,
+        {"format": "columnar", "fields": [...], "count": n, "columns": [[...], ...]},
+        built by transposing the tuples without creating a dict per row.
+        The built-in encoder writes the JSON text straight from the tuples with
+        per-column formatters chosen from column_types; the orjson backend
+        serializes in C instead.
+        """
+        formats = self.config['api'].get('payload_format', {})
+        layout = formats.get(self.endpoint_key(endpoint), formats.get('default', 'rows'))
+        column_types = column_types or {}
+        
+        if self.json_backend() == 'orjson':
+            if layout == 'columnar':
+                columns = [list(column) for column in zip(*rows)] if rows else [[] for _ in fields]
+                payload = {'format': 'columnar', 'fields': list(fields), 'count': len(rows), 'columns': columns}
             else:
-                print_status("User Accounts sync failed", "ERROR")
-            return ok
-        finally:
-            conn.close()
+                payload = [dict(zip(fields, row)) for row in rows]
+            return orjson.dumps(payload, default=decimal_to_float)
+        
+        if layout == 'columnar':
+            columns = zip(*rows) if rows else [() for _ in fields]
+            arrays = ','.join(
+                '[' + ','.join(map(formatter, column)) + ']'
+                for formatter, column in zip(column_formatters(fields, column_types), columns)
+            )
+            header = json.dumps(list(fields), separators=(',', ':'))
+            body = f'{{"format":"columnar","fields":{header},"count":{len(rows)},"columns":[{arrays}]}}'
+        else:
+            cache_key = (tuple(fields), tuple(sorted(column_types.items())))
+            encode = self.row_encoders.get(cache_key)
+            if encode is None:
+                encode = self.row_encoders[cache_key] = compile_row_encoder(fields, column_types)
+            body = '[' + ','.join(map(encode, rows)) + ']'
+        return body.encode('ascii')
 
+    def timed_post(self, endpoint, body, timeout=None, use_outbox=False, diverted=None):
+        """Post one encoded batch; returns (ok, response, elapsed seconds or None if not sent)
 
-# ---------- ITEM MASTER ----------
-class ItemsSync(BaseSync):
-    def __init__(self):
-        super().__init__('items_sync')
+        With use_outbox, a batch that cannot be delivered because the API is
+        unreachable (or that would overtake batches already queued for the
+        endpoint) is stored in the outbox and counts as acknowledged. The
+        first such batch sets the upload's diverted event, which sends the
+        upload's remaining batches to the outbox too. Batches already in
+        flight may still land first; the API upserts by key, so the order
+        they arrive in does not matter.
+        """
+        if use_outbox and ((diverted is not None and diverted.is_set()) or self.outbox.pending(endpoint)):
+            self.outbox.append(endpoint, body)
+            return True, "queued in outbox behind earlier batches", None
+        
+        started = time.monotonic()
+        ok, response, retryable = self.deliver(endpoint, body, timeout=timeout)
+        elapsed = time.monotonic() - started
+        if not ok and retryable and use_outbox:
+            if diverted is not None:
+                diverted.set()
+            self.outbox.append(endpoint, body)
+            self.logger.warning(f"API unavailable for {endpoint}, batch stored in outbox: {response}")
+            return True, "queued in outbox", elapsed
+        return ok, response, elapsed
 
-    def fetch(self, conn):
-        fields = self.config['items_sync']['fields']
-        sql = f"SELECT {', '.join(fields)} FROM tb_item_master"
-        cursor = conn.cursor()
-        cursor.execute(sql)
-        rows = [dict(zip(fields, row)) for row in cursor]
-        cursor.close()
-        self.logger.info(f"Fetched {len(rows)} tb_item_master records")
-        print_status(f"Fetched {len(rows)} item records", "SUCCESS")
-        return rows
+    def take_retry(self):
+        """Spend one retry from this run's budget, shared by every sync in the process; False once it is used up"""
+        with BaseSync._retry_lock:
+            if BaseSync._retries_left is None:
+                BaseSync._retries_left = self.config['api'].get('retry', {}).get('budget', 20)
+            if BaseSync._retries_left <= 0:
+                return False
+            BaseSync._retries_left -= 1
+            return True
 
-    def run(self):
-        print_status("Starting Items sync...", "PROGRESS")
-        conn = self.connect_to_database()
-        if not conn:
-            return False
+    @classmethod
+    def reset_retry_budget(cls):
+        """Start a new run's retry budget (api.retry.budget), taken on the next retry"""
+        with cls._retry_lock:
+            cls._retries_left = None
+
+    def retry_delay(self, attempt, retry_after=None):
+        """Exponential backoff with full jitter, or the server's Retry-After when it sent one"""
+        retry_cfg = self.config['api'].get('retry', {})
+        if retry_after is not None:
+            return min(retry_after, retry_cfg.get('max_delay', 30.0))
+        ceiling = min(retry_cfg.get('max_delay', 30.0), retry_cfg.get('base_delay', 1.0) * 2 ** (attempt - 1))
+        return random.uniform(0, ceiling)
+
+    def post_once(self, url, body, timeout, headers=None):
+        """Single POST; returns (status or None on network error, response, retry_after seconds)"""
         try:
-            data = self.fetch(conn)
-            if data is None:
-                return False
-            
-            # Process in batches with longer timeout to avoid timeout
-            batch_size = 1000
-            total_records = len(data)
+            with self.http_slots():
+                resp = self.http_session().post(
+                    url,
+                    data=body,
+                    headers=headers,
+                    timeout=timeout
+                )
+        except requests.RequestException as e:
+            return None, str(e), None
+        try:
+            response = resp.json() if resp.text else {}
+        except ValueError:
+            response = resp.text[:500]
+        retry_after = resp.headers.get('Retry-After')
+        retry_after = float(retry_after) if retry_after and retry_after.isdigit() else None
+        return resp.status_code, response, retry_after
+
+    def api_post(self, endpoint, data, timeout=None):
+        """POST data (records, or an already encoded JSON body) to an API endpoint"""
+        ok, response, _ = self.deliver(endpoint, data, timeout=timeout)
+        return ok, response
+
+    def deliver(self, endpoint, data, timeout=None, max_attempts=None):
+        """POST with retries; returns (ok, response, retryable) where retryable marks transient failures
+
+        Network errors and retryable statuses (RETRYABLE_STATUS) are retried
+        with backoff up to api.retry.max_attempts, while this run's retry
+        budget lasts. Other statuses fail straight away.
+        """
+        url = f"{self.config['api']['base_url']}{endpoint}"
+        body = data if isinstance(data, bytes) else self.encode_payload(data)
+        
+        # Use custom timeout if provided, otherwise use config timeout
+        request_timeout = timeout or self.config['api']['timeout']
+        if max_attempts is None:
+            max_attempts = self.config['api'].get('retry', {}).get('max_attempts', 5)
+        
+        # Compress once; every retry reuses the same wire body
+        body, content_encoding = self.compress_body(endpoint, body)
+        headers = {'Content-Encoding': content_encoding} if content_encoding else None
+        
+        attempt = 0
+        while True:
+            attempt += 1
+            # Pace requests from the endpoint's request and byte budget instead of fixed sleeps
+            request_bucket, byte_bucket = self.rate_limiter(endpoint)
+            waited = request_bucket.acquire() + byte_bucket.acquire(len(body))
+            if waited > 0:
+                self.logger.debug(f"Rate limit held {endpoint} request for {waited:.2f}s")
             
-            if total_records == 0:
-                self.logger.info("No items to sync")
-                print_status("No items to sync", "INFO")
-                return True
+            status, response, retry_after = self.post_once(url, body, request_timeout, headers)
+            if status == 200:
+                return True, response, False
             
-            self.logger.info(f"Processing {total_records} records in batches of {batch_size}")
-            print_status(f"Processing {total_records} records in batches of {batch_size}", "PROGRESS")
+            reason = f"HTTP {status}" if status is not None else response
+            if status is not None and status not in RETRYABLE_STATUS:
+                self.logger.error(f"POST {endpoint} failed with non-retryable {reason}")
+                return False, response, False
+            if attempt >= max_attempts or not self.take_retry():
+                self.logger.error(f"POST {endpoint} failed after {attempt} attempt(s): {reason}")
+                return False, response, True
             
-            for i in range(0, total_records, batch_size):
-                batch = data[i:i + batch_size]
-                batch_num = (i // batch_size) + 1
-                total_batches = (total_records + batch_size - 1) // batch_size
-                
-                self.logger.info(f"Sending batch {batch_num}/{total_batches} ({len(batch)} records)")
-                print_status(f"Sending batch {batch_num}/{total_batches} ({len(batch)} records)", "PROGRESS")
-                
-                # Use longer timeout for items (2 minutes)
-                ok, response = self.api_post(self.config['api']['items_endpoint'], batch, timeout=120)
-                if not ok:
-                    self.logger.error(f"Batch {batch_num} failed. Response: {response}")
-                    print_status(f"Batch {batch_num} failed: {response}", "ERROR")
-                    return False
-                
-                # Add small delay between batches to prevent overwhelming the server
-                if batch_num < total_batches:
-                    time.sleep(0.5)
-                    
-            self.logger.info("Items sync completed")
-            print_status("Items sync completed", "SUCCESS")
-            return True
-        finally:
-            conn.close()
+            delay = self.retry_delay(attempt, retry_after)
+            self.logger.warning(f"POST {endpoint} attempt {attempt} failed ({reason}), retrying in {delay:.1f}s")
+            time.sleep(delay)
 
 
-# ---------- DINE BILLS (7 days only) ----------
-class BillsSync(BaseSync):
-    def __init__(self):
-        super().__init__('bills_sync')
+# ---------- TABLE SYNC ENGINE ----------
+# Row conditions are kept in disjunctive normal form: a list of clauses that are
+# OR-ed, each a list of (field, op, value) tests that are AND-ed. [[]] matches every row.
+COMPARISONS = {'=': eq, '>': gt, '>=': ge, '<': lt, '<=': le}
+
+def condition_and(left, right):
+    """AND two conditions"""
+    return [a + b for a in left for b in right]
+
+def after_key(key, values):
+    """Condition for rows ordered after values on the key fields: k1 > ? OR (k1 = ? AND k2 > ?) ..."""
+    return [[(field, '=', values[field]) for field in key[:i]] + [(key[i], '>', values[key[i]])]
+            for i in range(len(key))]
+
+def condition_sql(condition, columns):
+    """SQL text and parameters of a condition, with fields mapped to quoted source columns"""
+    clauses, params = [], []
+    for clause in condition:
+        clauses.append("(" + " AND ".join(f'"{columns[field]}" {op} ?' for field, op, _ in clause) + ")")
+        params.extend(value for _, _, value in clause)
+    return " OR ".join(clauses), params
+
+def row_digest(record):
+    """Content hash of a converted row"""
+    return hashlib.blake2b(repr(record).encode('utf-8'), digest_size=16).hexdigest()
+
+def sortable_key(values):
+    """Key tuple comparable in Python the way the database orders it: times as ISO text
+
+    Numbers are left as they are, since int, float and Decimal compare
+    exactly with each other.
+    """
+    return tuple(value.isoformat() if hasattr(value, 'isoformat') else value for value in values)
+
+def matches(value, op, target):
+    """Python side of one condition test on a raw column value (CHAR padding ignored like SQL)"""
+    if value is None:
+        return False
+    if isinstance(value, str):
+        value = value.strip()
+    return COMPARISONS[op](value, target)
+
+
+class TableSync(BaseSync):
+    """Syncs one table spec (see table_specs) to its API endpoint
+
+    A spec gives:
+      name, title    result name (summary and state keys) and display label
+      source         source table; specs sharing a source are read in one SourceScan
+      fields         fields sent, in order; "columns" maps a field to a differently named source column
+      column_types   converter per field (see COLUMN_CONVERTERS)
+      endpoint       api config key of the endpoint, e.g. "kot_sales_endpoint"
+      upload         "single" (one request) or "batches" (adaptive, pipelined batches)
+      batch_size     starting batch size for "batches"
+      timeout        request timeout in seconds, unless api.timeouts sets one for the endpoint
+      outbox         let batches fall back to the local outbox
+      key            unique ordering key fields; the last acknowledged key is the watermark
+                     and, for "batches", the checkpoint an interrupted upload resumes after.
+                     Keyed sources are read in keyset pages of page_size rows
+      incremental    {"enabled", "overlap_minutes", "full_rebuild"}: send only rows after
+                     the watermark, or from the watermark's key[0] minus the overlap
+      filter         [[field, op, value], ...] conditions that are AND-ed
+      recent         {"column", "days"}: only rows from the last N days
+      primary_key    fields identifying a row
+      changes_only   with primary_key, send only rows whose content changed since the
+                     last successful run (see SnapshotStore) and report deleted keys
+      probe          cheap SQL aggregates (e.g. "COUNT(*)", "MAX(\"slno\")") whose values
+                     change whenever the rows this spec sends change (see SourceScan.probe)
+      detect_deletions  with primary_key and deletions_endpoint (the api config key of an
+                     endpoint that accepts tombstones), send tombstones for keys removed
+                     from the source (see send_tombstones)
+      delta          {"column", "lookback_days"} with primary_key: once a first full run
+                     has recorded which keys pass the filter, later runs read only rows
+                     from the last lookback_days whatever their filter value, and send
+                     rows that newly pass it (or changed) and rows that stopped passing
+                     it (see upload_delta)
+    Fields named in key, primary_key and (with delta) filter must be among the
+    spec's fields; other condition fields are read but not sent.
+
+    With value_range=(field, start, end) the instance resends only rows with
+    start <= field < end (see RangeReconciler), leaving watermarks,
+    checkpoints and snapshots alone.
+    """
+
+    def __init__(self, spec, value_range=None):
+        super().__init__('sync')
+        self.spec = spec
+        self.result_name = spec['name']
+        self.title = spec.get('title', spec['name'])
+        self.logger = logging.getLogger(spec['name'])
+        self.state_name = spec.get('state_name', spec['name'])
+        self.fields = spec['fields']
+        self.key = spec.get('key', [])
+        self.endpoint_name = spec['endpoint']
+        self.endpoint = self.config['api'][self.endpoint_name]
+        self.batched = spec.get('upload', 'single') == 'batches'
+        self.value_range = value_range
+        self.checkpointed = self.batched and bool(self.key) and value_range is None
+        self.incremental = spec.get('incremental', {})
+        self.primary_key = spec.get('primary_key', [])
+        self.changes_only = spec.get('changes_only', False) and bool(self.primary_key) and value_range is None
+        self.detect_deletions = spec.get('detect_deletions', False) and bool(self.primary_key) and value_range is None
+        if self.detect_deletions and 'deletions_endpoint' not in spec:
+            self.logger.warning(f"{self.title}: detect_deletions needs a deletions_endpoint, deletion checks are off")
+            self.detect_deletions = False
+        self.delta = spec.get('delta') if self.primary_key and value_range is None else None
+        self.delta_full = False
+        self.window = None
+        self.condition = None
 
-    def fetch(self, conn):
-        fields = self.config['bills_sync']['fields']
-        # Quote field names to handle reserved keywords like 'time', 'user', and 'date'
-        quoted_fields = [f'"{field}"' for field in fields]
+    def column_types(self):
+        return self.spec.get('column_types', {})
+
+    def condition_fields(self):
+        """Fields the spec's conditions use besides those it sends"""
+        used = [test[0] for test in self.spec.get('filter', [])]
+        for option in ('recent', 'delta', 'reconcile'):
+            if option in self.spec:
+                used.append(self.spec[option]['column'])
+        return [field for field in dict.fromkeys(used) if field not in self.fields]
+
+    def source_columns(self):
+        """{field: source column} for this spec's fields followed by its other condition fields"""
+        columns = self.spec.get('columns', {})
+        return {field: columns.get(field, field) for field in list(self.fields) + self.condition_fields()}
+
+    def static_filter_sql(self):
+        """SQL and parameters of the spec's filter conditions, or ("", []) without a filter"""
+        filters = [tuple(test) for test in self.spec.get('filter', [])]
+        if not filters:
+            return "", []
+        return condition_sql([filters], self.source_columns())
+
+    # ---------- KEYS / WINDOWS ----------
+    def key_value(self, field, value):
+        """Stored key value -> query value (ISO strings back to datetime, id strings to int)"""
+        kind = self.column_types().get(field)
+        if isinstance(value, str):
+            if kind == 'iso':
+                return datetime.fromisoformat(value)
+            if kind == 'id_str':
+                return int(value)
+        return value
+
+    def as_key(self, value):
+        """Key dict from a stored watermark or checkpoint; older state held a bare single-field value"""
+        if value is None or isinstance(value, dict):
+            return value
+        return {self.key[0]: value}
+
+    def last_key(self, rows):
+        """Key of the last row (in key order) whose key fields are all set, or None"""
+        positions = [self.fields.index(field) for field in self.key]
+        for row in reversed(rows):
+            if all(row[i] is not None for i in positions):
+                return {field: row[i] for field, i in zip(self.key, positions)}
+        return None
+
+    def start_window(self):
+        """Window for a new run: {'mode', 'after': key or None, 'since': ISO time or None}"""
+        full = {'mode': 'full', 'after': None, 'since': None}
+        if not self.key or not self.incremental.get('enabled', False):
+            return full
+        if self.incremental.get('full_rebuild', False):
+            self.logger.info(f"{self.title} full rebuild requested")
+            return full
+
+        watermark = self.as_key(self.get_watermark(self.state_name))
+        if not watermark:
+            self.logger.info(f"No {self.title} watermark yet, running full rebuild")
+            return full
+
+        self.logger.info(f"Resuming {self.title} sync after {watermark}")
+        if 'overlap_minutes' in self.incremental:
+            # Re-read a short overlap so rows saved late with an earlier time are not missed
+            overlap = timedelta(minutes=self.incremental['overlap_minutes'])
+            since = self.key_value(self.key[0], watermark[self.key[0]]) - overlap
+            return {'mode': 'incremental', 'after': None, 'since': since.isoformat()}
+        return {'mode': 'incremental', 'after': watermark, 'since': None}
+
+    def plan_window(self):
+        """Set self.window for this run and return the key to resume after (or None)
+
+        An interrupted upload keeps its original window and restarts after the
+        last acknowledged key.
+        """
+        checkpoint = self.load_checkpoint(self.state_name) if self.checkpointed else None
+        if checkpoint:
+            window = checkpoint['window']
+            self.window = {'mode': window['mode'], 'after': self.as_key(window.get('after')),
+                           'since': window.get('since')}
+            resume_key = self.as_key(checkpoint['last_key']) or self.window['after']
+            self.logger.info(f"Resuming interrupted {self.title} upload ({self.window['mode']}) after {resume_key}")
+            return resume_key
+
+        self.window = self.start_window()
+        if self.checkpointed:
+            self.save_checkpoint(self.state_name, self.window, None)
+        return self.window['after']
+
+    def scan_condition(self):
+        """This run's row condition (see condition_and); also kept as self.condition for wants()"""
+        condition = [[tuple(test) for test in self.spec.get('filter', [])]]
+        if self.value_range is not None:
+            field, start, end = self.value_range
+            self.window = {'mode': 'range', 'after': None, 'since': None}
+            self.condition = condition_and(condition, [[(field, '>=', start), (field, '<', end)]])
+            return self.condition
         
-        # SQL query to get only last 7 days data
-        sql = f"""SELECT {', '.join(quoted_fields)} 
-                  FROM dine_bill 
-                  WHERE "time" >= DATEADD(day, -7, GETDATE())
-                  ORDER BY "time" DESC"""
+        # Rows that left the filter must be read too, so a delta's filter is applied in upload_delta
+        if self.delta and self.delta_full:
+            condition = [[]]
+            self.logger.info(f"{self.title}: reported rows differ from the source, checking every row")
+        elif self.delta and self.state.get(self.state_key(f"{self.state_name}:baseline")):
+            cutoff = datetime.now() - timedelta(days=self.delta.get('lookback_days', 7))
+            condition = [[(self.delta['column'], '>=', cutoff)]]
+            self.logger.info(f"{self.title}: checking rows since {cutoff:%Y-%m-%d %H:%M} for changes")
         
+        recent = self.spec.get('recent')
+        if recent:
+            cutoff = datetime.now() - timedelta(days=recent['days'])
+            condition = condition_and(condition, [[(recent['column'], '>=', cutoff)]])
+
+        resume_key = self.plan_window()
+        if self.window['since']:
+            since = datetime.fromisoformat(self.window['since'])
+            condition = condition_and(condition, [[(self.key[0], '>=', since)]])
+        if resume_key:
+            values = {field: self.key_value(field, value) for field, value in resume_key.items()}
+            condition = condition_and(condition, after_key(self.key, values))
+        self.condition = condition
+        return condition
+
+    def wants(self, raw):
+        """Python mirror of scan_condition() for rows read on behalf of several specs
+
+        A delta's full scan reads every row but only wants those passing the
+        filter or already reported, so the rest of the source is not buffered.
+        """
+        at = self.at
+        if self.delta_full:
+            if all(matches(raw[at[field]], op, value) for field, op, value in self.spec.get('filter', [])):
+                return True
+            key = self.reported_key(tuple(raw[at[field]] for field in self.primary_key))
+            return '\x1f'.join(str(value) for value in key) in self.reported_keys
+        return any(all(matches(raw[at[field]], op, value) for field, op, value in clause)
+                   for clause in self.condition)
+
+    # ---------- UPLOAD ----------
+    def advance_watermark(self, batch):
+        """Record the last key the API has acknowledged, in the watermark and the checkpoint"""
+        if self.value_range is not None:
+            return
+        last_key = self.last_key(batch)
+        if last_key is not None:
+            self.set_watermark(self.state_name, last_key)
+            if self.checkpointed:
+                self.save_checkpoint(self.state_name, self.window, last_key)
+
+    def upload(self, records):
+        """Send records (tuples in self.fields order) as the spec's upload policy says"""
+        if self.delta:
+            return self.upload_delta(records)
+        if self.changes_only:
+            return self.upload_changes(records)
+        if self.batched:
+            return self.upload_in_batches(records)
+        return self.upload_once(list(records))
+
+    # ---------- DELETION DETECTION ----------
+    def iter_source_keys(self, conn):
+        """Stream the source's primary keys (as read) in key order, checking that the order matches sortable_key"""
+        columns = self.source_columns()
+        key_columns = ', '.join(f'"{columns[field]}"' for field in self.primary_key)
+        condition, params = self.static_filter_sql()
+        where = f"WHERE {condition}" if condition else ""
         cursor = conn.cursor()
-        cursor.execute(sql)
-        
-        rows = []
-        for row in cursor:
-            try:
-                row_dict = dict(zip(fields, row))
-                
-                # Handle datetime conversion
-                if row_dict.get('time'):
-                    if hasattr(row_dict['time'], 'isoformat'):
-                        row_dict['time'] = row_dict['time'].isoformat()
-                    elif row_dict['time'] is not None:
-                        # Convert to string if it's not None and doesn't have isoformat
-                        row_dict['time'] = str(row_dict['time'])
-                
-                # Handle date conversion - ADDED
-                if row_dict.get('date'):
-                    if hasattr(row_dict['date'], 'isoformat'):
-                        row_dict['date'] = row_dict['date'].isoformat()
-                    elif row_dict['date'] is not None:
-                        # Convert to string if it's not None and doesn't have isoformat
-                        row_dict['date'] = str(row_dict['date'])
-                
-                # Convert billno to string for JSON serialization
-                if row_dict.get('billno') is not None:
-                    row_dict['billno'] = str(int(float(row_dict['billno'])))
-                
-                # Handle user field - strip whitespace if it exists
-                if row_dict.get('user'):
-                    row_dict['user'] = str(row_dict['user']).strip()
-                
-                # Handle amount - ensure it's a proper decimal/float
-                if row_dict.get('amount') is not None:
-                    row_dict['amount'] = float(row_dict['amount'])
-                
-                rows.append(row_dict)
-                
-            except Exception as e:
-                self.logger.error(f"Error processing row {row}: {str(e)}")
-                continue
-        
-        cursor.close()
-        self.logger.info(f"Fetched {len(rows)} dine_bill records from last 7 days")
-        print_status(f"Fetched {len(rows)} bill records from last 7 days", "SUCCESS")
-        return rows
+        cursor.execute(f"""SELECT {key_columns}
+                  FROM {self.spec['source']}
+                  {where}
+                  ORDER BY {key_columns}""", *params)
+        try:
+            previous = None
+            for row in self.iter_rows(cursor):
+                if any(value is None for value in row):
+                    continue
+                key = sortable_key(row)
+                if previous is not None and key <= previous:
+                    raise ValueError(f"keys of {self.spec['source']} are not in a comparable order ({previous} then {key})")
+                previous = key
+                yield tuple(row)
+        finally:
+            cursor.close()
+
+    def send_tombstones(self, conn):
+        """Merge the source's sorted keys with the stored key set and post tombstones for missing keys
+
+        One pass over both sorted streams: a stored key smaller than the next
+        database key no longer exists. Missing keys are staged locally until
+        the merge has finished, so a source whose key order turns out not to
+        match is skipped before anything was posted. Tombstones then go to the
+        spec's deletions_endpoint in batches of batch_size as
+        {"deleted": {"fields": [...], "keys": [[...], ...]}}. The new key set
+        replaces the stored one only when every tombstone was acknowledged;
+        the first run just records the keys.
+        """
+        scope = self.state_key(f"{self.state_name}:keys")
+        staging = f"{scope}:next"
+        deleted_scope = f"{scope}:deleted"
+        endpoint_name = self.spec['deletions_endpoint']
+        endpoint = self.config['api'][endpoint_name]
+        batch_size = self.spec.get('batch_size', 500)
+        to_payload = compile_row_converter(self.primary_key, None, self.column_types())
+        first_run = not self.key_sets.exists(scope)
+        self.key_sets.clear(staging)
+        self.key_sets.clear(deleted_scope)
+
+        stored = self.key_sets.iter_keys(scope)
+        written, pending = 0, []
+        deleted_total, tombstones = 0, []
+
+        def stage_tombstones():
+            nonlocal deleted_total
+            if tombstones:
+                self.key_sets.append(deleted_scope, deleted_total, tombstones)
+                deleted_total += len(tombstones)
+                tombstones.clear()
 
-    def run(self):
-        print_status("Starting Bills (7 days) sync...", "PROGRESS")
-        conn = self.connect_to_database()
-        if not conn:
-            return False
         try:
-            data = self.fetch(conn)
-            if data is None:
-                return False
-            
-            # Log sample data for debugging
-            if data:
-                self.logger.info(f"Sample bill record: {data[0]}")
-                self.logger.info(f"Date range: Last 7 days from today")
-                print_status(f"Processing {len(data)} recent bill records", "PROGRESS")
-            else:
-                self.logger.info("No bill records found in the last 7 days")
-                print_status("No recent bill records found", "INFO")
-            
-            ok, response = self.api_post(self.config['api']['bills_endpoint'], data)
-            if ok:
-                self.logger.info("Bills sync completed")
-                print_status("Bills (7 days) sync completed", "SUCCESS")
-            else:
-                self.logger.error(f"Bills sync failed. Response: {response}")
-                print_status(f"Bills sync failed: {response}", "ERROR")
-            return ok
-        except Exception as e:
-            self.logger.error(f"Bills sync error: {str(e)}")
-            print_status(f"Bills sync error: {str(e)}", "ERROR")
+            # Keys are compared in their sortable form but stored and posted as read
+            old = next(stored, None)
+            for key in self.iter_source_keys(conn):
+                current = sortable_key(key)
+                while old is not None and sortable_key(old) < current:
+                    tombstones.append(old)
+                    old = next(stored, None)
+                if old is not None and sortable_key(old) == current:
+                    old = next(stored, None)
+                pending.append(key)
+                if len(pending) >= 1000:
+                    self.key_sets.append(staging, written, pending)
+                    written += len(pending)
+                    pending = []
+                if len(tombstones) >= 1000:
+                    stage_tombstones()
+            while old is not None:
+                tombstones.append(old)
+                old = next(stored, None)
+            stage_tombstones()
+        except ValueError as e:
+            self.logger.warning(f"{self.title} deletion check skipped: {e}")
+            self.key_sets.clear(staging)
+            self.key_sets.clear(deleted_scope)
+            return True
+        if pending:
+            self.key_sets.append(staging, written, pending)
+            written += len(pending)
+
+        def post_tombstones(batch):
+            body = self.encode_payload({'deleted': {'fields': self.primary_key,
+                                                    'keys': [list(to_payload(key)) for key in batch]}})
+            sent, response = self.api_post(endpoint, body, timeout=self.request_timeout(endpoint_name))
+            if not sent:
+                self.logger.error(f"{self.title} tombstones failed. Response: {response}")
+            return sent
+
+        ok = True
+        batch = []
+        for key in self.key_sets.iter_keys(deleted_scope):
+            batch.append(key)
+            if len(batch) >= batch_size:
+                ok = post_tombstones(batch)
+                if not ok:
+                    break
+                batch = []
+        else:
+            if batch:
+                ok = post_tombstones(batch)
+        self.key_sets.clear(deleted_scope)
+
+        if not ok:
+            self.key_sets.clear(staging)
+            print_status(f"{self.title} deletion tombstones failed", "ERROR")
             return False
-        finally:
-            conn.close()
+        self.key_sets.publish(staging, scope)
+        if first_run:
+            self.logger.info(f"{self.title}: recorded {written} keys for deletion checks")
+        else:
+            self.logger.info(f"{self.title}: {written} keys checked, {deleted_total} deletions sent")
+            if deleted_total:
+                print_status(f"{self.title}: {deleted_total} deleted rows sent to API", "SUCCESS")
+        return True
 
+    # ---------- CHANGE DETECTION ----------
+    def send_records(self, records):
+        """Upload a record stream as the spec's upload policy says; nothing is posted for no records"""
+        if self.batched:
+            return self.upload_in_batches(records)
+        data = list(records)
+        return self.upload_once(data) if data else True
 
-# ---------- NEW: DINE BILLS MONTH (ALL data) ----------
-class BillsMonthSync(BaseSync):
-    def __init__(self):
-        super().__init__('bills_sync')  # Use same config as bills_sync
+    def check_reported(self, conn):
+        """Set delta_full when the keys passing the filter no longer number as many as the reported keys
 
-    def fetch(self, conn):
-        fields = self.config['bills_sync']['fields']
-        # Quote field names to handle reserved keywords like 'time', 'user', and 'date'
-        quoted_fields = [f'"{field}"' for field in fields]
-        
-        # SQL query to get ALL data (no date filter)
-        sql = f"""SELECT {', '.join(quoted_fields)} 
-                  FROM dine_bill 
-                  ORDER BY "time" DESC"""
-        
+        A row that starts or stops passing the filter outside the lookback (a
+        bill cancelled weeks later) changes that count, so the next scan reads
+        the whole source instead of just the lookback. Keys are counted
+        distinct and non-NULL, the way the snapshot holds them.
+        """
+        if not self.delta or not self.state.get(self.state_key(f"{self.state_name}:baseline")):
+            return
+        columns = self.source_columns()
+        key_columns = [f'"{columns[field]}"' for field in self.primary_key]
+        condition, params = self.static_filter_sql()
+        tests = [f"{column} IS NOT NULL" for column in key_columns] + ([f"({condition})"] if condition else [])
         cursor = conn.cursor()
-        cursor.execute(sql)
-        
-        rows = []
-        for row in cursor:
-            try:
-                row_dict = dict(zip(fields, row))
-                
-                # Handle datetime conversion
-                if row_dict.get('time'):
-                    if hasattr(row_dict['time'], 'isoformat'):
-                        row_dict['time'] = row_dict['time'].isoformat()
-                    elif row_dict['time'] is not None:
-                        # Convert to string if it's not None and doesn't have isoformat
-                        row_dict['time'] = str(row_dict['time'])
-                
-                # Handle date conversion
-                if row_dict.get('date'):
-                    if hasattr(row_dict['date'], 'isoformat'):
-                        row_dict['date'] = row_dict['date'].isoformat()
-                    elif row_dict['date'] is not None:
-                        # Convert to string if it's not None and doesn't have isoformat
-                        row_dict['date'] = str(row_dict['date'])
-                
-                # Convert billno to string for JSON serialization
-                if row_dict.get('billno') is not None:
-                    row_dict['billno'] = str(int(float(row_dict['billno'])))
-                
-                # Handle user field - strip whitespace if it exists
-                if row_dict.get('user'):
-                    row_dict['user'] = str(row_dict['user']).strip()
-                
-                # Handle amount - ensure it's a proper decimal/float
-                if row_dict.get('amount') is not None:
-                    row_dict['amount'] = float(row_dict['amount'])
-                
-                rows.append(row_dict)
-                
-            except Exception as e:
-                self.logger.error(f"Error processing row {row}: {str(e)}")
-                continue
+        try:
+            cursor.execute(f"""SELECT COUNT(*) FROM (
+                      SELECT DISTINCT {', '.join(key_columns)}
+                      FROM {self.spec['source']}
+                      WHERE {' AND '.join(tests)}) AS passing""", *params)
+            current = int(cursor.fetchone()[0])
+        finally:
+            cursor.close()
+        scope = self.state_key(self.state_name)
+        mismatch_key = self.state_key(f"{self.state_name}:count_mismatch")
+        reported = self.snapshots.count(scope)
+        self.delta_full = current != reported
+        if not self.delta_full:
+            self.state.delete(mismatch_key)
+            return
         
-        cursor.close()
-        self.logger.info(f"Fetched {len(rows)} dine_bill records (ALL data)")
-        print_status(f"Fetched {len(rows)} bill records (ALL data)", "SUCCESS")
-        return rows
+        if self.state.get(mismatch_key) == [current, reported]:
+            self.logger.warning(
+                f"{self.title}: {current} keys pass the filter but {reported} were reported, "
+                f"the same as before the last full rescan; check for rows that fail to convert"
+            )
+        else:
+            self.logger.info(f"{self.title}: {current} keys pass the filter but {reported} were reported")
+        self.state.set(mismatch_key, [current, reported])
+        self.reported_keys = set(self.snapshots.hashes(scope))
+        self.reported_key = compile_row_converter(self.primary_key, None, self.column_types())
 
-    def run(self):
-        print_status("Starting Bills Month (ALL) sync...", "PROGRESS")
-        conn = self.connect_to_database()
-        if not conn:
+    def upload_delta(self, records):
+        """Send only rows whose filter membership or content changed since they were last reported
+
+        Rows without a complete primary key cannot be tracked and are skipped.
+        The snapshot (see SnapshotStore) holds the keys reported as passing the
+        filter, e.g. the billnos sent as cancelled. A row passing the filter is
+        sent when its key is new or its content changed; a reported row that no
+        longer passes is sent with its current values (e.g. un-cancelled) and
+        dropped from the snapshot. Reported keys not read this run, because they
+        are older than the lookback, are left alone, except after a full scan
+        (see check_reported), where they no longer exist and are dropped.
+        """
+        scope = self.state_key(self.state_name)
+        reported = self.snapshots.hashes(scope)
+        key_positions = [self.fields.index(field) for field in self.primary_key]
+        tests = [(self.fields.index(field), op, value) for field, op, value in self.spec.get('filter', [])]
+        added, removed, seen = {}, [], set()
+
+        def delta_rows():
+            for record in records:
+                if any(record[i] is None for i in key_positions):
+                    continue
+                key = '\x1f'.join(str(record[i]) for i in key_positions)
+                if self.delta_full:
+                    seen.add(key)
+                if all(matches(record[i], op, value) for i, op, value in tests):
+                    digest = row_digest(record)
+                    if reported.get(key) != digest:
+                        added[key] = digest
+                        yield record
+                elif key in reported:
+                    removed.append(key)
+                    yield record
+
+        if not self.send_records(delta_rows()):
             return False
+        if self.delta_full:
+            gone = [key for key in reported if key not in seen]
+            if gone:
+                self.logger.info(f"{self.title}: {len(gone)} reported rows no longer exist: {gone[:20]}")
+            removed.extend(gone)
+        self.snapshots.apply(scope, added, removed)
+        self.state.set(self.state_key(f"{self.state_name}:baseline"), True)
+        self.logger.info(f"{self.title}: {len(added)} new or changed, {len(removed)} no longer matching the filter")
+        if not added and not removed:
+            print_status(f"{self.title} unchanged, nothing to send", "SUCCESS")
+        else:
+            print_status(f"{self.title}: {len(added)} new or changed, {len(removed)} reverted", "SUCCESS")
+        return True
+
+    def upload_changes(self, records):
+        """Upload only inserted or changed rows; the snapshot is updated once the upload succeeded
+
+        A row's snapshot key is its primary key values joined by a unit
+        separator. Deleted rows are the snapshot keys not seen in this run's
+        scan. Nothing is posted when no row changed.
+        """
+        scope = self.state_key(self.state_name)
+        previous = self.snapshots.hashes(scope)
+        key_positions = [self.fields.index(field) for field in self.primary_key]
+        changed, seen = {}, set()
+        total = 0
+
+        def changed_rows():
+            nonlocal total
+            for record in records:
+                total += 1
+                key = '\x1f'.join(str(record[i]) for i in key_positions)
+                digest = row_digest(record)
+                seen.add(key)
+                if previous.get(key) != digest:
+                    changed[key] = digest
+                    yield record
+
+        if not self.send_records(changed_rows()):
+            return False
+
+        deleted = [key for key in previous if key not in seen]
+        self.snapshots.apply(scope, changed, deleted)
+        self.logger.info(
+            f"{self.title}: {total} rows scanned, {len(changed)} inserted or changed, {len(deleted)} deleted"
+        )
+        if deleted:
+            self.logger.info(f"{self.title} keys deleted since the last run: {deleted[:20]}")
+        if not changed and not deleted:
+            print_status(f"{self.title} unchanged, nothing to send", "SUCCESS")
+        else:
+            print_status(f"{self.title}: {len(changed)} changed, {len(deleted)} deleted", "SUCCESS")
+        return True
+
+    def upload_once(self, data):
+        if data:
+            self.logger.info(f"Sample {self.result_name} record: {dict(zip(self.fields, data[0]))}")
+            print_status(f"Sending {len(data)} {self.title} records to API...", "PROGRESS")
+        else:
+            self.logger.info(f"No {self.title} records found")
+            print_status(f"No {self.title} records found", "INFO")
+
+        ok, response = self.api_post(
+            self.endpoint, self.encode_rows(self.endpoint, self.fields, data, self.column_types()),
+            timeout=self.request_timeout(self.endpoint_name, self.spec.get('timeout'))
+        )
+        if ok:
+            if self.key:
+                self.advance_watermark(data)
+            self.logger.info(f"{self.title} sync completed")
+            print_status(f"{self.title} sync completed", "SUCCESS")
+        else:
+            self.logger.error(f"{self.title} sync failed. Response: {response}")
+            print_status(f"{self.title} sync failed: {response}", "ERROR")
+        return ok
+
+    def upload_in_batches(self, records):
+        # Stream rows straight into adaptively sized batches to avoid timeout and memory growth
+        batcher = self.make_batcher(self.spec.get('batch_size', 500))
+        self.logger.info(f"Streaming {self.title} records in batches starting at {batcher.size}")
+        print_status(f"Streaming {self.title} records in batches starting at {batcher.size}", "PROGRESS")
+
+        # Batches are fetched and converted in a producer thread while earlier ones upload
+        depth = self.config['sync'].get('pipeline_depth', 4)
+        batches = self.prefetch(self.iter_batches(records, batcher), depth, self.result_name)
         try:
-            data = self.fetch(conn)
-            if data is None:
-                return False
-            
-            total_records = len(data)
-            
-            if total_records == 0:
-                self.logger.info("No bill records found")
-                print_status("No bill records found", "INFO")
-                return True
-            
-            # Process in batches to avoid timeout with large datasets
-            batch_size = 500  # Smaller batch size for large datasets
-            self.logger.info(f"Processing {total_records} records in batches of {batch_size}")
-            print_status(f"Processing {total_records} records in batches of {batch_size}", "PROGRESS")
-            
-            for i in range(0, total_records, batch_size):
-                batch = data[i:i + batch_size]
-                batch_num = (i // batch_size) + 1
-                total_batches = (total_records + batch_size - 1) // batch_size
-                
-                self.logger.info(f"Sending Bills Month batch {batch_num}/{total_batches} ({len(batch)} records)")
-                print_status(f"Sending Bills Month batch {batch_num}/{total_batches} ({len(batch)} records)", "PROGRESS")
-                
-                # Use longer timeout for large datasets (5 minutes)
-                ok, response = self.api_post(self.config['api']['bills_month_endpoint'], batch, timeout=300)
-                if not ok:
-                    self.logger.error(f"Bills Month batch {batch_num} failed. Response: {response}")
-                    print_status(f"Bills Month batch {batch_num} failed: {response}", "ERROR")
-                    return False
-                
-                # Add delay between batches for large datasets
-                if batch_num < total_batches:
-                    time.sleep(1.0)
-            
-            self.logger.info("Bills Month sync completed")
-            print_status("Bills Month sync completed", "SUCCESS")
-            return True
-        except Exception as e:
-            self.logger.error(f"Bills Month sync error: {str(e)}")
-            print_status(f"Bills Month sync error: {str(e)}", "ERROR")
+            # Timeouts come from the spec or api.timeouts; pacing comes from the rate limiter
+            ok, total_records, total_batches = self.upload_batches(
+                self.endpoint,
+                batches,
+                self.title,
+                timeout=self.request_timeout(self.endpoint_name, self.spec.get('timeout')),
+                on_ack=self.advance_watermark if self.key else None,
+                batcher=batcher,
+                use_outbox=self.spec.get('outbox', False),
+                fields=self.fields,
+                column_types=self.column_types()
+            )
+        finally:
+            batches.close()
+        if not ok:
             return False
+        if self.checkpointed:
+            self.clear_checkpoint(self.state_name)
+
+        if total_records == 0:
+            self.logger.info(f"No new {self.title} records found")
+            print_status(f"No new {self.title} records found", "INFO")
+            return True
+
+        self.logger.info(f"{self.title} sync completed ({total_records} records in {total_batches} batches)")
+        print_status(f"{self.title} sync completed", "SUCCESS")
+        return True
+
+
+class SourceScan(BaseSync):
+    """Reads one source table once and routes each converted row to every TableSync reading it
+
+    The query selects the union of the routes' fields and ORs their
+    conditions; each row is converted once and projected into every route
+    whose wants() accepts it. Before the scan each route gets route.at, the
+    position of every scanned field in the raw row, and route.project, which
+    picks its fields out of a converted row. The first route uploading in
+    batches streams its upload while the scan runs; the others receive their
+    rows once the scan has finished. Rows come in the key order of the
+    streaming route, else of the first route with a key.
+    """
+
+    def __init__(self, routes):
+        super().__init__('sync')
+        self.routes = routes
+        self.source = routes[0].spec['source']
+        self.streaming_route = next((route for route in routes if route.batched), None)
+        self.draining = False
+
+    def scan_columns(self):
+        """{field: source column} over all routes, in first-seen order"""
+        columns = {}
+        for route in self.routes:
+            for field, column in route.source_columns().items():
+                columns.setdefault(field, column)
+        return columns
+
+    def column_types(self):
+        # Routes reading the same field agree on its type, so their converter maps can simply be merged
+        types = {}
+        for route in self.routes:
+            types.update(route.column_types())
+        return types
+
+    def probe(self, conn):
+        """Current values of the routes' probe aggregates, or None when a route has no probe
+
+        When every route of the source has a probe and the values equal those
+        stored after the last fully successful run, the source has not changed
+        and run() skips it without reading a row.
+        """
+        if not self.config['sync'].get('skip_unchanged', True):
+            return None
+        expressions = []
+        for route in self.routes:
+            if not route.spec.get('probe') or route.value_range is not None:
+                return None
+            expressions.extend(expr for expr in route.spec['probe'] if expr not in expressions)
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"SELECT {', '.join(expressions)} FROM {self.source}")
+            row = cursor.fetchone()
         finally:
-            conn.close()
+            cursor.close()
+        return {expr: str(value) for expr, value in zip(expressions, row)}
 
+    def route_condition(self, columns):
+        """SQL covering every route's condition (None when a route needs all rows) and its parameters"""
+        route_conditions = [route.scan_condition() for route in self.routes]
+        if any(not clause for condition in route_conditions for clause in condition):
+            return None, []
+        return condition_sql([clause for condition in route_conditions for clause in condition], columns)
 
-# ---------- KOT SALES DETAIL ----------
-class KotSalesSync(BaseSync):
-    def __init__(self):
-        super().__init__('kot_sales_sync')
+    def page_size(self):
+        """Rows per keyset page; a spec's page_size overrides sync.page_size, 0 reads in one query"""
+        sizes = [route.spec['page_size'] for route in self.routes if 'page_size' in route.spec]
+        return sizes[0] if sizes else self.config['sync'].get('page_size', 5000)
 
-    def fetch(self, conn):
-        fields = self.config['kot_sales_sync']['fields']
-        # Quote field names to handle any reserved keywords
-        quoted_fields = [f'"{field}"' for field in fields]
-        
-        # SQL query to get ALL data (no date filter)
-        sql = f"""SELECT {', '.join(quoted_fields)} 
-                  FROM dine_kot_sales_detail
-                  ORDER BY "slno" DESC"""
+    def iter_pages(self, cursor, next_sql, params, key_positions, page_size):
+        """Yield rows from an already executed first page, then fetch the following pages
+
+        Each page starts after the key of the previous page's last row. next_sql
+        is the same text for every page and runs on the same cursor, so the
+        driver prepares it once. A full page ending on a NULL key raises
+        ValueError, failing the sync instead of silently dropping the rest.
+        """
+        pages = 1
+        while True:
+            count, last = 0, None
+            for row in self.iter_rows(cursor):
+                count += 1
+                last = row
+                yield row
+            if count < page_size:
+                break
+            last_key = [last[i] for i in key_positions]
+            if any(value is None for value in last_key):
+                # The next page cannot start after a NULL; stopping here would drop the remaining rows
+                raise ValueError(f"{self.source} page ended on a NULL key; set \"page_size\": 0 "
+                                 f"on its table spec to read it in one query")
+            page_params = list(params)
+            for i in range(len(last_key)):
+                page_params.extend(last_key[:i + 1])
+            cursor.execute(next_sql, *page_params)
+            pages += 1
+        self.logger.info(f"Read {self.source} in {pages} page(s) of up to {page_size} rows")
+
+    def scan(self, conn, buffers):
+        """Yield records for the streaming route while filling buffers for the other routes"""
+        columns = self.scan_columns()
+        fields = list(columns)
+        # Quote names to handle reserved keywords like 'time', 'user', and 'date'
+        select = ', '.join(f'"{column}"' if column == field else f'"{column}" AS "{field}"'
+                           for field, column in columns.items())
+
+        for route in self.routes:
+            route.at = {field: index for index, field in enumerate(fields)}
+            positions = [route.at[field] for field in route.fields]
+            route.project = itemgetter(*positions) if len(positions) > 1 else (lambda row, i=positions[0]: (row[i],))
+
+        condition, params = self.route_condition(columns)
+        keyed = [route for route in self.routes if route.key]
+        order_route = self.streaming_route if self.streaming_route in keyed else next(iter(keyed), None)
+        order_key = order_route.key if order_route is not None else []
+        order = ""
+        if order_key:
+            order = "ORDER BY " + ", ".join(f'"{columns[field]}" ASC' for field in order_key)
         
+        # Keyset pagination: TOP n pages in key order, each continuing after the last key read,
+        # so the key index is walked in order and no page needs a sort of the whole table
+        page_size = self.page_size() if order_key else 0
+        top = f"TOP {int(page_size)} " if page_size > 0 else ""
+        where = f"WHERE {condition}" if condition else ""
+        sql = f"""SELECT {top}{select}
+                  FROM {self.source}
+                  {where}
+                  {order}"""
+
         cursor = conn.cursor()
-        cursor.execute(sql)
-        
-        rows = []
-        for row in cursor:
-            try:
-                row_dict = dict(zip(fields, row))
-                
-                # Convert slno to string for JSON serialization
-                if row_dict.get('slno') is not None:
-                    row_dict['slno'] = str(int(float(row_dict['slno'])))
-                
-                # Convert billno to string for JSON serialization
-                if row_dict.get('billno') is not None:
-                    row_dict['billno'] = str(int(float(row_dict['billno'])))
-                
-                # Handle item field - strip whitespace if it exists
-                if row_dict.get('item'):
-                    row_dict['item'] = str(row_dict['item']).strip()
-                
-                # Handle qty - ensure it's a proper decimal/float
-                if row_dict.get('qty') is not None:
-                    row_dict['qty'] = float(row_dict['qty'])
-                
-                # Handle rate - ensure it's a proper decimal/float
-                if row_dict.get('rate') is not None:
-                    row_dict['rate'] = float(row_dict['rate'])
-                
-                rows.append(row_dict)
-                
-            except Exception as e:
-                self.logger.error(f"Error processing KOT row {row}: {str(e)}")
-                continue
+        cursor.execute(sql, *params)
         
-        cursor.close()
-        self.logger.info(f"Fetched {len(rows)} dine_kot_sales_detail records (ALL data)")
-        print_status(f"Fetched {len(rows)} KOT sales detail records (ALL data)", "SUCCESS")
-        return rows
+        rows = self.iter_rows(cursor)
+        if page_size > 0:
+            after_sql, _ = condition_sql(after_key(order_key, dict.fromkeys(order_key)), columns)
+            next_where = f"WHERE ({condition}) AND ({after_sql})" if condition else f"WHERE {after_sql}"
+            next_sql = f"""SELECT {top}{select}
+                  FROM {self.source}
+                  {next_where}
+                  {order}"""
+            rows = self.iter_pages(cursor, next_sql, params, [fields.index(field) for field in order_key], page_size)
+
+        convert = compile_row_converter(fields, cursor.description, self.column_types())
+        single = len(self.routes) == 1
+        counts = {route: 0 for route in self.routes}
+        try:
+            for row in rows:
+                try:
+                    if self.draining:
+                        matched = [route for route in buffers if route.wants(row)]
+                    else:
+                        # A lone route gets exactly the rows its own WHERE clause selected
+                        matched = self.routes if single else [route for route in self.routes if route.wants(row)]
+                    if not matched:
+                        continue
+                    # Converted once, whatever the number of routes
+                    record = convert(row)
+                except Exception as e:
+                    self.logger.error(f"Error processing {self.source} row {row}: {str(e)}")
+                    continue
+
+                for route in matched:
+                    counts[route] += 1
+                    projected = route.project(record)
+                    if route is self.streaming_route:
+                        yield projected
+                    else:
+                        buffers[route].append(projected)
+        finally:
+            cursor.close()
+
+        for route in self.routes:
+            self.logger.info(f"Fetched {counts[route]} {self.source} records for {route.result_name}")
+        print_status(f"Read {self.source} once for {len(self.routes)} table sync(s)", "SUCCESS")
 
     def run(self):
-        print_status("Starting KOT Sales Detail sync...", "PROGRESS")
+        """Returns a list of (result_name, success) in route order"""
+        print_status(f"Starting {', '.join(route.title for route in self.routes)} sync...", "PROGRESS")
         conn = self.connect_to_database()
         if not conn:
-            return False
+            return [(route.result_name, False) for route in self.routes]
         try:
-            data = self.fetch(conn)
-            if data is None:
-                return False
-            
-            total_records = len(data)
-            
-            if total_records == 0:
-                self.logger.info("No KOT sales detail records found")
-                print_status("No KOT sales detail records found", "INFO")
-                return True
+            probe = self.probe(conn)
+            probe_key = self.state_key(f"{self.source}:probe")
+            if probe is not None and probe == self.state.get(probe_key):
+                self.logger.info(f"{self.source} unchanged since the last run ({probe}), skipped")
+                print_status(f"{self.source} unchanged since the last run, skipped", "SUCCESS")
+                return [(route.result_name, True) for route in self.routes]
             
-            # Process in batches to avoid timeout with large datasets
-            batch_size = 500  # Reduced batch size for very large datasets
-            self.logger.info(f"Processing {total_records} records in batches of {batch_size}")
-            print_status(f"Processing {total_records} records in batches of {batch_size}", "PROGRESS")
+            for route in self.routes:
+                route.check_reported(conn)
+            buffers = {route: [] for route in self.routes if route is not self.streaming_route}
+            results = {}
+
+            records = self.scan(conn, buffers)
+            if self.streaming_route is not None:
+                results[self.streaming_route] = self.streaming_route.upload(records)
+                if buffers:
+                    # If the streaming upload stopped early, finish the scan for the buffered routes only
+                    self.draining = True
+                else:
+                    records.close()
+            # Fill the buffers from whatever is left of the scan
+            for _ in records:
+                pass
+
+            for route, data in buffers.items():
+                results[route] = route.upload(data)
             
-            for i in range(0, total_records, batch_size):
-                batch = data[i:i + batch_size]
-                batch_num = (i // batch_size) + 1
-                total_batches = (total_records + batch_size - 1) // batch_size
-                
-                self.logger.info(f"Sending KOT batch {batch_num}/{total_batches} ({len(batch)} records)")
-                print_status(f"Sending KOT batch {batch_num}/{total_batches} ({len(batch)} records)", "PROGRESS")
-                
-                # Use longer timeout for large datasets (5 minutes)
-                ok, response = self.api_post(self.config['api']['kot_sales_endpoint'], batch, timeout=300)
-                if not ok:
-                    self.logger.error(f"KOT batch {batch_num} failed. Response: {response}")
-                    print_status(f"KOT batch {batch_num} failed: {response}", "ERROR")
-                    return False
-                
-                # Add longer delay between batches for very large datasets
-                if batch_num < total_batches:
-                    time.sleep(1.0)  # Increased from 0.5 to 1.0 second
+            for route in self.routes:
+                if route.detect_deletions and results[route]:
+                    results[route] = route.send_tombstones(conn)
             
-            self.logger.info("KOT Sales Detail sync completed")
-            print_status("KOT Sales Detail sync completed", "SUCCESS")
-            return True
+            # The probe is only recorded once everything read from the source has been delivered
+            if probe is not None and all(results.values()):
+                self.state.set(probe_key, probe)
+            return [(route.result_name, results[route]) for route in self.routes]
         except Exception as e:
-            self.logger.error(f"KOT Sales Detail sync error: {str(e)}")
-            print_status(f"KOT Sales Detail sync error: {str(e)}", "ERROR")
-            return False
+            self.logger.error(f"{self.source} sync error: {str(e)}")
+            print_status(f"{self.source} sync error: {str(e)}", "ERROR")
+            return [(route.result_name, False) for route in self.routes]
         finally:
-            conn.close()
+            self.release_connection(conn)
 
 
-# ---------- CANCELLED BILLS ----------
-class CancelledBillsSync(BaseSync):
-    def __init__(self):
-        super().__init__('cancelled_bills_sync')
+# ---------- RANGE RECONCILIATION ----------
+class RangeReconciler(BaseSync):
+    """Compares per-range aggregates of a table with the API's and resends only the ranges that differ
 
-    def fetch(self, conn):
-        fields = self.config['cancelled_bills_sync']['fields']
-        # Quote field names to handle reserved keywords like 'date'
-        quoted_fields = [f'"{field}"' for field in fields]
-        
-        # SQL query to get ALL records from dine_bill table where colnstatus = 'C'
-        # (no date filter - fetch all cancelled bills)
-        sql = f"""SELECT {', '.join(quoted_fields)} 
-                  FROM dine_bill 
-                  WHERE "colnstatus" = 'C'
-                  ORDER BY "billno" DESC"""
-        
+    spec["reconcile"] gives:
+      endpoint       api config key of the checksum endpoint. It receives
+                     {"table", "column", "ranges": [[start, end], ...]} and answers
+                     {"ranges": [{"count", "sum", "checksum"}, ...]} in the same order
+      column         field the ranges are taken over (datetime or numeric)
+      top_level      "day", or a bucket width for a numeric column
+      sum, checksum  SQL expressions summed per range; the API sums the same ones
+      min_span       range width (seconds for datetimes) at which a differing range
+                     is resent instead of split further
+    Ranges are half open, [start, end). The first level is one GROUP BY
+    query; a differing range is split in two and both halves are compared
+    again, Merkle style, until the differing ranges are small enough to resend.
+    """
+
+    def __init__(self, spec):
+        super().__init__('sync')
+        self.spec = spec
+        self.reconcile = spec['reconcile']
+        self.table = TableSync(spec)
+        self.result_name = f"{spec['name']} (reconcile)"
+        self.title = self.table.title
+        self.field = self.reconcile['column']
+        self.column = f'"{self.table.source_columns()[self.field]}"'
+        self.endpoint_name = self.reconcile['endpoint']
+        self.endpoint = self.config['api'][self.endpoint_name]
+        self.logger = logging.getLogger(self.result_name)
+
+    def aggregates_sql(self):
+        return f"COUNT(*), SUM({self.reconcile['sum']}), SUM({self.reconcile['checksum']})"
+
+    def top_level_ranges(self, conn):
+        """[(start, end, local aggregates)] for every first-level bucket holding rows"""
+        top_level = self.reconcile.get('top_level', 'day')
+        bucket = f"DATE({self.column})" if top_level == 'day' else f"FLOOR({self.column} / {int(top_level)})"
+        condition, params = self.table.static_filter_sql()
+        where = f"WHERE {self.column} IS NOT NULL" + (f" AND ({condition})" if condition else "")
         cursor = conn.cursor()
-        cursor.execute(sql)
-        
-        rows = []
-        for row in cursor:
-            try:
-                row_dict = dict(zip(fields, row))
-                
-                # Convert billno to string for JSON serialization
-                if row_dict.get('billno') is not None:
-                    row_dict['billno'] = str(int(float(row_dict['billno'])))
-                
-                # Handle date conversion
-                if row_dict.get('date'):
-                    if hasattr(row_dict['date'], 'isoformat'):
-                        row_dict['date'] = row_dict['date'].isoformat()
-                    elif row_dict['date'] is not None:
-                        # Convert to string if it's not None and doesn't have isoformat
-                        row_dict['date'] = str(row_dict['date'])
-                
-                # Handle creditcard field - strip whitespace if it exists
-                if row_dict.get('creditcard'):
-                    row_dict['creditcard'] = str(row_dict['creditcard']).strip()
-                
-                # Handle colnstatus field - strip whitespace if it exists
-                if row_dict.get('colnstatus'):
-                    row_dict['colnstatus'] = str(row_dict['colnstatus']).strip()
-                
-                rows.append(row_dict)
-                
-            except Exception as e:
-                self.logger.error(f"Error processing cancelled bills row {row}: {str(e)}")
+        cursor.execute(f"""SELECT {bucket} AS bucket, {self.aggregates_sql()}
+                  FROM {self.spec['source']}
+                  {where}
+                  GROUP BY {bucket}
+                  ORDER BY 1""", *params)
+        ranges = []
+        try:
+            for row in self.iter_rows(cursor):
+                if top_level == 'day':
+                    start = datetime.fromisoformat(str(row[0]))
+                    end = start + timedelta(days=1)
+                else:
+                    start = int(row[0]) * int(top_level)
+                    end = start + int(top_level)
+                ranges.append((start, end, tuple(row[1:])))
+        finally:
+            cursor.close()
+        return ranges
+
+    def local_aggregates(self, conn, start, end):
+        condition, params = self.table.static_filter_sql()
+        cursor = conn.cursor()
+        cursor.execute(f"""SELECT {self.aggregates_sql()}
+                  FROM {self.spec['source']}
+                  WHERE {self.column} >= ? AND {self.column} < ?{f" AND ({condition})" if condition else ""}""",
+                       start, end, *params)
+        try:
+            return tuple(cursor.fetchone())
+        finally:
+            cursor.close()
+
+    def remote_aggregates(self, ranges):
+        """The API's (count, sum, checksum) for each (start, end), or None if it could not answer"""
+        payload = {
+            'table': self.spec['name'],
+            'column': self.field,
+            'ranges': [[start.isoformat() if hasattr(start, 'isoformat') else start,
+                        end.isoformat() if hasattr(end, 'isoformat') else end] for start, end in ranges]
+        }
+        ok, response = self.api_post(self.endpoint, payload, timeout=self.request_timeout(self.endpoint_name))
+        answers = response.get('ranges') if ok and isinstance(response, dict) else None
+        if not isinstance(answers, list) or len(answers) != len(ranges):
+            self.logger.error(f"{self.title} checksum request failed. Response: {response}")
+            return None
+        return [(answer.get('count'), answer.get('sum'), answer.get('checksum')) for answer in answers]
+
+    @staticmethod
+    def same(local, remote):
+        local_count, local_sum, local_checksum = local
+        remote_count, remote_sum, remote_checksum = remote
+        return (
+            int(local_count or 0) == int(remote_count or 0)
+            and abs(float(local_sum or 0) - float(remote_sum or 0)) < 0.005
+            and int(local_checksum or 0) == int(remote_checksum or 0)
+        )
+
+    def span(self, start, end):
+        return (end - start).total_seconds() if isinstance(start, datetime) else end - start
+
+    def differing(self, ranges):
+        """[(start, end)] of the (start, end, local aggregates) ranges the API disagrees on, or None"""
+        found = []
+        for offset in range(0, len(ranges), 200):
+            chunk = ranges[offset:offset + 200]
+            remote = self.remote_aggregates([(start, end) for start, end, _ in chunk])
+            if remote is None:
+                return None
+            found.extend((start, end) for (start, end, local), theirs in zip(chunk, remote)
+                         if not self.same(local, theirs))
+        return found
+
+    def find_stale_ranges(self, conn):
+        """Leaf ranges to resend, narrowed down from the first level by bisection, or None on API failure"""
+        pending = self.differing(self.top_level_ranges(conn))
+        if pending is None:
+            return None
+        min_span = self.reconcile.get('min_span', 3600)
+        stale = []
+        while pending:
+            start, end = pending.pop()
+            if self.span(start, end) <= min_span:
+                stale.append((start, end))
                 continue
-        
-        cursor.close()
-        self.logger.info(f"Fetched {len(rows)} cancelled_bills records (colnstatus='C', ALL data)")
-        print_status(f"Fetched {len(rows)} cancelled bills records (colnstatus='C', ALL data)", "SUCCESS")
-        return rows
+            middle = start + (end - start) / 2 if isinstance(start, datetime) else (start + end) // 2
+            halves = [(start, middle), (middle, end)]
+            narrowed = self.differing([(lo, hi, self.local_aggregates(conn, lo, hi)) for lo, hi in halves])
+            if narrowed is None:
+                return None
+            pending.extend(narrowed)
+        return stale
 
     def run(self):
-        print_status("Starting Cancelled Bills sync...", "PROGRESS")
+        """Returns (result_name, success)"""
+        print_status(f"Reconciling {self.title} with the API...", "PROGRESS")
         conn = self.connect_to_database()
         if not conn:
-            return False
+            return self.result_name, False
         try:
-            data = self.fetch(conn)
-            if data is None:
-                return False
-            
-            # Log sample data for debugging
-            if data:
-                self.logger.info(f"Sample cancelled bill record: {data[0]}")
-                self.logger.info(f"Date range: All data where colnstatus='C'")
-                print_status(f"Processing {len(data)} cancelled bill records", "PROGRESS")
-            else:
-                self.logger.info("No cancelled bill records (colnstatus='C') found")
-                print_status("No cancelled bill records (colnstatus='C') found", "INFO")
-            
-            ok, response = self.api_post(self.config['api']['cancelled_bills_endpoint'], data)
-            if ok:
-                self.logger.info("Cancelled Bills sync completed")
-                print_status("Cancelled Bills sync completed", "SUCCESS")
-            else:
-                self.logger.error(f"Cancelled Bills sync failed. Response: {response}")
-                print_status(f"Cancelled Bills sync failed: {response}", "ERROR")
-            return ok
+            stale = self.find_stale_ranges(conn)
         except Exception as e:
-            self.logger.error(f"Cancelled Bills sync error: {str(e)}")
-            print_status(f"Cancelled Bills sync error: {str(e)}", "ERROR")
-            return False
+            self.logger.error(f"{self.title} reconciliation error: {str(e)}")
+            print_status(f"{self.title} reconciliation error: {str(e)}", "ERROR")
+            return self.result_name, False
         finally:
-            conn.close()
+            self.release_connection(conn)
+        if stale is None:
+            print_status(f"{self.title} reconciliation failed: API checksums unavailable", "ERROR")
+            return self.result_name, False
+        if not stale:
+            self.logger.info(f"{self.title} matches the API")
+            print_status(f"{self.title} matches the API", "SUCCESS")
+            return self.result_name, True
+
+        # Adjacent leaf ranges are resent together
+        merged = []
+        for start, end in sorted(stale):
+            if merged and merged[-1][1] == start:
+                merged[-1] = (merged[-1][0], end)
+            else:
+                merged.append((start, end))
+        self.logger.info(f"{self.title}: {len(stale)} ranges differ, resending {merged}")
+        print_status(f"{self.title}: resending {len(merged)} differing ranges", "PROGRESS")
+
+        ok = True
+        for start, end in merged:
+            route = TableSync(self.spec, value_range=(self.field, start, end))
+            ok = SourceScan([route]).run()[0][1] and ok
+        return self.result_name, ok
+
+
+# ---------- ORCHESTRATION ----------
+# The six POS tables. config.json "tables" entries with the same name override
+# these key by key (one level deep for dicts such as "reconcile"); entries with
+# a new name add tables. Features that need API support stay off here.
+BILL_TYPES = {'billno': 'id_str', 'time': 'iso', 'user': 'strip', 'amount': 'float', 'date': 'iso'}
+BILL_PROBE = ["COUNT(*)", 'MAX("time")', 'MAX("billno")']
+
+DEFAULT_TABLE_SPECS = [
+    {
+        'name': 'acc_users',
+        'title': 'User Accounts',
+        'source': 'acc_users',
+        'fields': ['id', 'password'],
+        'columns': {'password': 'pass'},
+        'column_types': {'id': 'text', 'password': 'text'},
+        'primary_key': ['id'],
+        'changes_only': True,
+        'endpoint': 'endpoint',
+        'upload': 'single'
+    },
+    {
+        'name': 'tb_item_master',
+        'title': 'Items',
+        'source': 'tb_item_master',
+        'fields': ['item_code', 'item_name', 'rate', 'rate1', 'rate2', 'rate3',
+                   'rate4', 'rate5', 'rate6', 'rate7', 'kitchen', 'category'],
+        'primary_key': ['item_code'],
+        'changes_only': True,
+        'endpoint': 'items_endpoint',
+        'upload': 'batches',
+        'batch_size': 1000,
+        'timeout': 120
+    },
+    {
+        'name': 'dine_bill (7 days)',
+        'title': 'Bills (7 days)',
+        'source': 'dine_bill',
+        'fields': list(BILL_TYPES),
+        'column_types': BILL_TYPES,
+        'key': ['time', 'billno'],
+        'recent': {'column': 'time', 'days': 7},
+        'probe': BILL_PROBE,
+        'endpoint': 'bills_endpoint',
+        'upload': 'single'
+    },
+    {
+        'name': 'dine_bill_month (ALL)',
+        'title': 'Bills Month',
+        'source': 'dine_bill',
+        'state_name': 'dine_bill_month',
+        'fields': list(BILL_TYPES),
+        'column_types': BILL_TYPES,
+        'key': ['time', 'billno'],
+        'incremental': {'enabled': True, 'overlap_minutes': 60, 'full_rebuild': False},
+        'primary_key': ['billno'],
+        'probe': BILL_PROBE,
+        'reconcile': {
+            'enabled': False,
+            'endpoint': 'bills_month_checksum_endpoint',
+            'column': 'time',
+            'top_level': 'day',
+            'sum': '"amount"',
+            'checksum': 'MOD(CAST("billno" AS BIGINT) * 1000003 + CAST(ROUND("amount" * 100, 0) AS BIGINT), 2147483647)',
+            'min_span': 3600
+        },
+        'endpoint': 'bills_month_endpoint',
+        'upload': 'batches',
+        'batch_size': 500,
+        'timeout': 300,
+        'outbox': True
+    },
+    {
+        'name': 'dine_kot_sales_detail',
+        'title': 'KOT Sales Detail',
+        'source': 'dine_kot_sales_detail',
+        'fields': ['slno', 'billno', 'item', 'qty', 'rate'],
+        'column_types': {'slno': 'id_str', 'billno': 'id_str', 'item': 'strip', 'qty': 'float', 'rate': 'float'},
+        'key': ['slno'],
+        'incremental': {'enabled': True},
+        'probe': ["COUNT(*)", 'MAX("slno")'],
+        'reconcile': {
+            'enabled': False,
+            'endpoint': 'kot_sales_checksum_endpoint',
+            'column': 'slno',
+            'top_level': 10000,
+            'sum': '"qty" * "rate"',
+            'checksum': 'MOD(CAST("slno" AS BIGINT) * 1000003 + CAST(ROUND("qty" * "rate" * 100, 0) AS BIGINT), 2147483647)',
+            'min_span': 500
+        },
+        'endpoint': 'kot_sales_endpoint',
+        'upload': 'batches',
+        'batch_size': 500,
+        'timeout': 300,
+        'outbox': True
+    },
+    {
+        'name': 'cancelled_bills',
+        'title': 'Cancelled Bills',
+        'source': 'dine_bill',
+        'fields': ['billno', 'date', 'creditcard', 'colnstatus'],
+        'column_types': {'billno': 'id_str', 'date': 'iso', 'creditcard': 'strip', 'colnstatus': 'strip'},
+        'filter': [['colnstatus', '=', 'C']],
+        'primary_key': ['billno'],
+        'delta': {'column': 'time', 'lookback_days': 7},
+        'probe': ["COUNT(*)", "SUM(CASE WHEN \"colnstatus\" = 'C' THEN 1 ELSE 0 END)",
+                  "SUM(CASE WHEN \"colnstatus\" = 'C' THEN \"billno\" ELSE 0 END)"],
+        'endpoint': 'cancelled_bills_endpoint',
+        'upload': 'batches',
+        'batch_size': 500
+    }
+]
+
+# Older config.json files list each table's fields in a section of their own
+LEGACY_FIELD_SECTIONS = {
+    'tb_item_master': 'items_sync',
+    'dine_bill (7 days)': 'bills_sync',
+    'dine_bill_month (ALL)': 'bills_sync',
+    'dine_kot_sales_detail': 'kot_sales_sync',
+    'cancelled_bills': 'cancelled_bills_sync',
+}
+
+def merge_spec(base, override):
+    spec = dict(base)
+    for option, value in override.items():
+        if isinstance(value, dict) and isinstance(spec.get(option), dict):
+            value = {**spec[option], **value}
+        spec[option] = value
+    return spec
+
+def table_specs(config):
+    """DEFAULT_TABLE_SPECS with the config's legacy field lists and "tables" entries applied"""
+    specs = {}
+    for spec in DEFAULT_TABLE_SPECS:
+        section = config.get(LEGACY_FIELD_SECTIONS.get(spec['name']), {})
+        specs[spec['name']] = merge_spec(spec, {'fields': section['fields']}) if 'fields' in section else spec
+    for entry in config.get('tables', []):
+        specs[entry['name']] = merge_spec(specs[entry['name']], entry) if entry['name'] in specs else entry
+    return list(specs.values())
+
+def build_sync_jobs(config):
+    """One job per source table in table_specs(): (title, result names, job)
+
+    Each job returns a list of (table_name, success). Specs with the same
+    source share a single read of it.
+    """
+    groups = {}
+    for spec in table_specs(config):
+        if spec.get('enabled', True):
+            groups.setdefault(spec['source'], []).append(spec)
+
+    return [
+        (", ".join(spec.get('title', spec['name']) for spec in specs),
+         [spec['name'] for spec in specs],
+         lambda specs=specs: SourceScan([TableSync(spec) for spec in specs]).run())
+        for specs in groups.values()
+    ]
+
+def run_reconciliation(config):
+    """Reconcile every spec with reconcile.enabled against the API; returns [(name, success)]"""
+    return [RangeReconciler(spec).run() for spec in table_specs(config)
+            if spec.get('reconcile', {}).get('enabled', False)]
+
+
+def run_sync_jobs(jobs, max_parallel):
+    """Run independent sync jobs concurrently; results keep the job order for print_summary
+
+    Database and HTTP concurrency are capped globally by database.pool_size
+    and api.max_concurrent_requests, whatever max_parallel is.
+    """
+    logger = logging.getLogger('main')
+    
+    def run_job(step, title, names, job):
+        print_status(f"Step {step}/{len(jobs)}: Syncing {title}", "PROGRESS")
+        try:
+            return job()
+        except Exception as e:
+            logger.error(f"{title} sync error: {str(e)}")
+            print_status(f"{title} sync error: {str(e)}", "ERROR")
+            return [(name, False) for name in names]
+    
+    with ThreadPoolExecutor(max_workers=max(1, max_parallel)) as executor:
+        futures = [executor.submit(run_job, step, *job) for step, job in enumerate(jobs, 1)]
+        results = []
+        for future in futures:
+            results.extend(future.result())
+    return results
 
 
 # ---------- MAIN ----------
@@ -652,41 +2362,38 @@ def main():
     print_header()
     
     print_status("Initializing sync process...", "PROGRESS")
-    print_status("Syncing 6 tables: acc_users, tb_item_master, dine_bill (7 days), dine_bill_month (ALL), dine_kot_sales_detail, cancelled_bills", "INFO")
+    BaseSync.reset_retry_budget()
+    base = BaseSync('sync')
+    jobs = build_sync_jobs(base.config)
+    names = [name for _, job_names, _ in jobs for name in job_names]
+    if not jobs:
+        logging.getLogger('main').error("No tables to sync: config.json enables no table specs")
+        print_status("No tables to sync: config.json enables no table specs", "ERROR")
+        print_summary([])
+        input("\nPress Enter to exit...")
+        return
+    print_status(f"Syncing {len(names)} tables: {', '.join(names)}", "INFO")
     print()
     
-    # Run all syncs automatically
-    sync_results = []
+    # Batches left over from earlier outages are sent in the background while the syncs run
+    drainer = OutboxDrainer(base)
+    if base.outbox.pending():
+        print_status(f"{base.outbox.pending()} batches waiting in the local outbox, sending in background", "INFO")
+    drainer.start()
     
-    print_status("Step 1/6: Syncing User Accounts", "PROGRESS")
-    ok1 = AccUsersSync().run()
-    sync_results.append(("acc_users", ok1))
+    # Run all syncs automatically, independent tables in parallel
+    max_parallel = base.config['sync'].get('max_parallel_tables', 4)
+    sync_results = run_sync_jobs(jobs, max_parallel)
+    # Reconciliation runs after the regular upload so it only finds real gaps
+    sync_results.extend(run_reconciliation(base.config))
     print()
     
-    print_status("Step 2/6: Syncing Item Master", "PROGRESS")
-    ok2 = ItemsSync().run()
-    sync_results.append(("tb_item_master", ok2))
-    print()
+    pending = drainer.stop()
+    if pending:
+        print_status(f"{pending} batches are still in the local outbox and will be sent on the next run", "INFO")
     
-    print_status("Step 3/6: Syncing Recent Bills (7 days)", "PROGRESS")
-    ok3 = BillsSync().run()
-    sync_results.append(("dine_bill (7 days)", ok3))
-    print()
-    
-    print_status("Step 4/6: Syncing All Bills (Month)", "PROGRESS")
-    ok4 = BillsMonthSync().run()
-    sync_results.append(("dine_bill_month (ALL)", ok4))
-    print()
-    
-    print_status("Step 5/6: Syncing KOT Sales Detail", "PROGRESS")
-    ok5 = KotSalesSync().run()
-    sync_results.append(("dine_kot_sales_detail", ok5))
-    print()
-    
-    print_status("Step 6/6: Syncing Cancelled Bills", "PROGRESS")
-    ok6 = CancelledBillsSync().run()
-    sync_results.append(("cancelled_bills", ok6))
-    print()
+    BaseSync.close_pool()
+    BaseSync.close_session()
     
     # Print final summary
     print_summary(sync_results)
@@ -0,0 +1,80 @@
+import math
+import os
+import re
+import sqlite3
+import sys
+
+import pytest
+
+# sync.py is a single script at the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+
+class Cursor:
+    """pyodbc-style cursor (execute(sql, *params)) over SQLite, recording what it executed
+
+    SQL Anywhere's TOP n is rewritten to a trailing LIMIT n and BIGINT casts to INTEGER.
+    """
+
+    def __init__(self, conn, executed):
+        self.cursor = conn.cursor()
+        self.executed = executed
+
+    @property
+    def description(self):
+        return self.cursor.description
+
+    def execute(self, sql, *params):
+        self.executed.append((sql, list(params)))
+        top = re.search(r"\bTOP (\d+) ", sql)
+        if top:
+            sql = sql.replace(top.group(0), "", 1) + f" LIMIT {top.group(1)}"
+        self.cursor.execute(sql.replace('BIGINT', 'INTEGER'), params)
+        return self
+
+    def fetchone(self):
+        return self.cursor.fetchone()
+
+    def fetchmany(self, size):
+        return self.cursor.fetchmany(size)
+
+    def close(self):
+        self.cursor.close()
+
+
+class Connection:
+    """In-memory SQLite database standing in for the POS database"""
+
+    def __init__(self):
+        self.conn = sqlite3.connect(':memory:', check_same_thread=False, detect_types=sqlite3.PARSE_DECLTYPES)
+        self.conn.create_function('FLOOR', 1, math.floor)
+        self.conn.create_function('MOD', 2, lambda a, b: a % b)
+        self.executed = []
+
+    def cursor(self):
+        return Cursor(self.conn, self.executed)
+
+
+@pytest.fixture
+def sync_config(tmp_path, monkeypatch):
+    """Point BaseSync at a config dict, a Connection and a fresh state store; returns the sync module"""
+    pytest.importorskip("pyodbc")
+    pytest.importorskip("requests")
+    import sync
+
+    monkeypatch.chdir(tmp_path)
+
+    def apply(config, conn):
+        config.setdefault('database', {'dsn': 'TEST'})
+        config.setdefault('outbox', {'enabled': False})
+        config.setdefault('state', {'path': str(tmp_path / 'sync_state.db')})
+        monkeypatch.setattr(sync.BaseSync, 'load_config', lambda self: config)
+        monkeypatch.setattr(sync.BaseSync, 'connect_to_database', lambda self: conn)
+        monkeypatch.setattr(sync.BaseSync, 'release_connection', lambda self, conn: None)
+        for name in ('_state', '_outbox', '_snapshots', '_key_sets', '_http_slots', '_retries_left'):
+            monkeypatch.setattr(sync.BaseSync, name, None)
+        monkeypatch.setattr(sync.BaseSync, '_rate_limiters', {})
+        return sync
+
+    yield apply
+    sync.BaseSync.close_session()
@@ -0,0 +1,79 @@
+"""Keyset-paginated scans (SourceScan.scan / iter_pages) over a two-column key
+
+The database is SQLite behind a cursor that turns TOP n into LIMIT n and
+records every statement with its parameters.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import Connection
+
+BILLS_SPEC = {
+    'name': 'dine_bill_month (ALL)',
+    'title': 'Bills Month',
+    'source': 'dine_bill',
+    'fields': ['billno', 'time', 'amount'],
+    'column_types': {'billno': 'id_str', 'time': 'iso', 'amount': 'float'},
+    'filter': [['colnstatus', '=', 'N']],
+    'key': ['time', 'billno'],
+    'page_size': 4,
+    'endpoint': 'bills_month_endpoint',
+    'upload': 'batches',
+}
+
+START = datetime(2026, 1, 1, 9, 0)
+
+
+def bills_database(rows):
+    conn = Connection()
+    conn.conn.execute('CREATE TABLE dine_bill (billno INTEGER, "time" TIMESTAMP, amount REAL, colnstatus TEXT)')
+    conn.conn.executemany('INSERT INTO dine_bill VALUES (?, ?, ?, ?)', rows)
+    return conn
+
+
+@pytest.fixture
+def scan_bills(sync_config):
+    """Run a SourceScan of BILLS_SPEC alone; returns (records, connection)"""
+
+    def run(rows):
+        conn = bills_database(rows)
+        sync = sync_config({
+            'api': {'base_url': 'http://127.0.0.1:9', 'timeout': 10, 'bills_month_endpoint': '/api/bills_month/'},
+            'sync': {'log_level': 'WARNING'},
+        }, conn)
+        source = sync.SourceScan([sync.TableSync(BILLS_SPEC)])
+        return list(source.scan(conn, {})), conn
+
+    return run
+
+
+def test_pages_follow_the_two_column_key(scan_bills):
+    # Three bills share each time, so page boundaries fall inside a run of equal times
+    rows = [(billno, START + timedelta(minutes=(billno - 1) // 3), 10.0 * billno, 'N') for billno in range(1, 12)]
+    rows.append((99, START, 5.0, 'C'))
+
+    records, conn = scan_bills(rows)
+
+    assert [record[0] for record in records] == [str(billno) for billno in range(1, 12)]
+    assert len(conn.executed) == 3
+    first_sql, first_params = conn.executed[0]
+    assert 'TOP 4 ' in first_sql and first_params == ['N']
+
+    # Later pages reuse one statement: filter, then (time > ?) OR (time = ? AND billno > ?)
+    (next_sql, second_params), (third_sql, third_params) = conn.executed[1:]
+    assert next_sql == third_sql
+    assert '("colnstatus" = ?)) AND ((' in next_sql
+    page_end = START + timedelta(minutes=1)
+    assert second_params == ['N', page_end, page_end, 4]
+    assert third_params == ['N', START + timedelta(minutes=2), START + timedelta(minutes=2), 8]
+
+
+def test_page_ending_on_null_key_fails_instead_of_dropping_rows(scan_bills):
+    # NULL times sort first, so the whole first page ends on a NULL key
+    rows = [(billno, None, 1.0, 'N') for billno in range(1, 5)]
+    rows += [(billno, START + timedelta(minutes=billno), 1.0, 'N') for billno in range(5, 9)]
+
+    with pytest.raises(ValueError, match="NULL key"):
+        scan_bills(rows)
@@ -0,0 +1,147 @@
+"""RangeReconciler against a local stub of the checksum API
+
+The POS database is stood in for by SQLite and the API by a small HTTP
+server holding the "cloud" copy of dine_kot_sales_detail.
+"""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from conftest import Connection
+
+
+def checksum(slno, qty, rate):
+    return (slno * 1000003 + round(qty * rate * 100)) % 2147483647
+
+
+class StubApi(ThreadingHTTPServer):
+    """Answers checksum requests from self.rows and records every upload"""
+
+    def __init__(self, rows):
+        super().__init__(('127.0.0.1', 0), StubHandler)
+        self.rows = rows
+        self.checksum_requests = []
+        self.uploads = []
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        data = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        if self.path == '/api/kot_sales/checksums/':
+            self.server.checksum_requests.append(data['ranges'])
+            answers = []
+            for start, end in data['ranges']:
+                rows = [row for slno, row in self.server.rows.items() if start <= slno < end]
+                answers.append({
+                    'count': len(rows),
+                    'sum': sum(qty * rate for _, qty, rate in rows),
+                    'checksum': sum(checksum(slno, qty, rate) for slno, qty, rate in rows),
+                })
+            body = json.dumps({'ranges': answers}).encode()
+        else:
+            self.server.uploads.append(data)
+            body = b'{"ok": true}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def kot_database(rows):
+    conn = Connection()
+    conn.conn.execute('CREATE TABLE dine_kot_sales_detail (slno INTEGER, billno INTEGER, item TEXT, qty REAL, rate REAL)')
+    conn.conn.executemany('INSERT INTO dine_kot_sales_detail VALUES (?, ?, ?, ?, ?)',
+                          [(slno, slno // 3, 'item', qty, rate) for slno, qty, rate in rows])
+    return conn
+
+
+KOT_SPEC = {
+    'name': 'dine_kot_sales_detail',
+    'title': 'KOT Sales Detail',
+    'source': 'dine_kot_sales_detail',
+    'fields': ['slno', 'billno', 'item', 'qty', 'rate'],
+    'column_types': {'slno': 'id_str', 'billno': 'id_str', 'item': 'strip', 'qty': 'float', 'rate': 'float'},
+    'key': ['slno'],
+    'page_size': 0,
+    'reconcile': {
+        'enabled': True,
+        'endpoint': 'kot_sales_checksum_endpoint',
+        'column': 'slno',
+        'top_level': 100,
+        'sum': '"qty" * "rate"',
+        'checksum': 'MOD(CAST("slno" AS BIGINT) * 1000003 + CAST(ROUND("qty" * "rate" * 100, 0) AS BIGINT), 2147483647)',
+        'min_span': 10,
+    },
+    'endpoint': 'kot_sales_endpoint',
+    'upload': 'batches',
+    'batch_size': 500,
+}
+
+
+@pytest.fixture
+def local_rows():
+    return [(slno, 2.0, 12.5) for slno in range(1, 1001)]
+
+
+@pytest.fixture
+def reconcile(sync_config):
+    """Run RangeReconciler for KOT_SPEC against local rows and a stub API; returns (result, stub)"""
+
+    def run(local_rows, cloud_rows):
+        stub = StubApi({slno: (slno, qty, rate) for slno, qty, rate in cloud_rows})
+        threading.Thread(target=stub.serve_forever, daemon=True).start()
+        sync = sync_config({
+            'api': {
+                'base_url': stub.base_url,
+                'timeout': 10,
+                'retry': {'max_attempts': 1},
+                'kot_sales_endpoint': '/api/kot_sales/',
+                'kot_sales_checksum_endpoint': '/api/kot_sales/checksums/',
+            },
+            'sync': {'log_level': 'WARNING', 'pipeline_depth': 0},
+        }, kot_database(local_rows))
+        try:
+            return sync.RangeReconciler(KOT_SPEC).run(), stub
+        finally:
+            stub.shutdown()
+            stub.server_close()
+
+    return run
+
+
+def resent_slnos(stub):
+    return sorted(int(row['slno']) for batch in stub.uploads for row in batch)
+
+
+def test_matching_data_resends_nothing(reconcile, local_rows):
+    (name, ok), stub = reconcile(local_rows, local_rows)
+
+    assert (name, ok) == ('dine_kot_sales_detail (reconcile)', True)
+    assert len(stub.checksum_requests) == 1
+    assert stub.uploads == []
+
+
+def test_differing_ranges_are_bisected_and_resent(reconcile, local_rows):
+    # The cloud copy is missing slno 137 and has a different qty for slno 642
+    cloud_rows = [(slno, 3.0 if slno == 642 else qty, rate) for slno, qty, rate in local_rows if slno != 137]
+
+    (_, ok), stub = reconcile(local_rows, cloud_rows)
+
+    assert ok
+    # One request for the 100-wide top level, then one per bisection step
+    assert len(stub.checksum_requests) > 2
+    assert all(len(ranges) == 2 for ranges in stub.checksum_requests[1:])
+    # Only the narrowed-down ranges around the two rows are resent:
+    # [100, 200) -> [100, 150) -> [125, 150) -> [137, 150) -> [137, 143)
+    assert resent_slnos(stub) == list(range(137, 143)) + list(range(637, 643))